@@ -0,0 +1,369 @@
+"""A compact binary format for Bril.
+
+This module reads and writes Bril programs in a binary encoding that is
+smaller than JSON. Every string in the program (opcodes, variable
+names, labels, keys, and so on) is stored once in a string table and
+referenced by index everywhere else, and all integers are varints. The
+encoding can represent any JSON value, so it round-trips every field of
+the program, including extensions and source positions.
+
+There are two commands: `bril2bin`, which converts a program from JSON
+to the binary format, and `bin2bril`, which converts it back.
+
+The layout is:
+
+- The magic bytes `MAGIC`.
+- A varint count of strings, then that many strings, each a varint
+  byte length followed by its UTF-8 bytes.
+- The program as a single value. A value is a one-byte tag followed by
+  a payload that depends on the tag: nothing for `null` and the
+  booleans, a varint for integers (the magnitude, for negative
+  integers) and string-table indices, 8 little-endian bytes for floats,
+  a varint length followed by the elements for lists, and a varint
+  length followed by key index/value pairs for objects.
+
+There is also an *indexed* variant of the format, which lets tools
+decode individual functions without touching the rest of the program.
+It starts with `INDEX_MAGIC` and the 8-byte little-endian offset of the
+index. Then come the functions, each encoded as a standalone binary
+program as above, followed by the program's other fields (e.g.,
+`structs`) encoded the same way. The index at the end is a varint count
+of functions, then each function's name (a varint length and UTF-8
+bytes), offset, and length as varints, and finally the offset and
+length of the other fields. Use `Container` (or `open_container`, which
+memory-maps a file) to read it.
+"""
+
+import json
+import mmap
+import struct
+import sys
+
+__version__ = '0.0.1'
+
+MAGIC = b'BRIL\x00\x01'
+INDEX_MAGIC = b'BRIL\x00\x02'
+
+# Value tags.
+NULL, FALSE, TRUE, INT, NEG_INT, FLOAT, STR, LIST, DICT = range(9)
+
+_double = struct.Struct('<d')
+_offset = struct.Struct('<Q')
+
+
+# Writer.
+
+def _varint(out, n):
+    """Append an unsigned LEB128 varint to a bytearray."""
+    while n >= 0x80:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+class _Writer:
+    def __init__(self):
+        self.strings = {}
+        self.out = bytearray()
+
+    def intern(self, s):
+        """Get the string-table index for `s`, adding it if needed."""
+        idx = self.strings.get(s)
+        if idx is None:
+            idx = self.strings[s] = len(self.strings)
+        return idx
+
+    def value(self, val):
+        out = self.out
+        if isinstance(val, str):
+            out.append(STR)
+            _varint(out, self.intern(val))
+        elif isinstance(val, dict):
+            out.append(DICT)
+            _varint(out, len(val))
+            for key, item in val.items():
+                _varint(out, self.intern(key))
+                self.value(item)
+        elif isinstance(val, list):
+            out.append(LIST)
+            _varint(out, len(val))
+            for item in val:
+                self.value(item)
+        elif val is True:
+            out.append(TRUE)
+        elif val is False:
+            out.append(FALSE)
+        elif val is None:
+            out.append(NULL)
+        elif isinstance(val, int):
+            if val >= 0:
+                out.append(INT)
+                _varint(out, val)
+            else:
+                out.append(NEG_INT)
+                _varint(out, -val)
+        elif isinstance(val, float):
+            out.append(FLOAT)
+            out += _double.pack(val)
+        else:
+            raise TypeError('cannot encode {!r}'.format(val))
+
+
+def dumps(prog):
+    """Encode a Bril program (or any JSON value) as bytes."""
+    writer = _Writer()
+    writer.value(prog)
+
+    out = bytearray(MAGIC)
+    _varint(out, len(writer.strings))
+    for s in writer.strings:
+        data = s.encode('utf-8')
+        _varint(out, len(data))
+        out += data
+    out += writer.out
+    return bytes(out)
+
+
+def dump(prog, fp):
+    """Write a Bril program to the binary file-like object `fp`."""
+    fp.write(dumps(prog))
+
+
+def _write_str(out, s):
+    data = s.encode('utf-8')
+    _varint(out, len(data))
+    out += data
+
+
+def dumps_indexed(prog):
+    """Encode a Bril program as bytes in the indexed format.
+
+    `prog['functions']` may be any iterable of functions.
+    """
+    out = bytearray(INDEX_MAGIC)
+    out += _offset.pack(0)  # Placeholder for the index offset.
+
+    entries = []
+    for func in prog['functions']:
+        data = dumps(func)
+        entries.append((func['name'], len(out), len(data)))
+        out += data
+    rest_pos = len(out)
+    out += dumps({k: v for k, v in prog.items() if k != 'functions'})
+    rest_len = len(out) - rest_pos
+
+    # Write the index and fill in its offset.
+    _offset.pack_into(out, len(INDEX_MAGIC), len(out))
+    _varint(out, len(entries))
+    for name, pos, length in entries:
+        _write_str(out, name)
+        _varint(out, pos)
+        _varint(out, length)
+    _varint(out, rest_pos)
+    _varint(out, rest_len)
+    return bytes(out)
+
+
+def dump_indexed(prog, fp):
+    """Write a Bril program to the binary file-like object `fp` in the
+    indexed format.
+    """
+    fp.write(dumps_indexed(prog))
+
+
+# Reader.
+
+def is_binary(data):
+    """Check whether `data` (bytes) starts like a binary Bril program,
+    in either the plain or the indexed format.
+    """
+    return data[:len(MAGIC)] in (MAGIC, INDEX_MAGIC)
+
+
+def _read_varint(data, pos):
+    """Read a varint from `data` at `pos`. Return the value and the
+    position after it.
+    """
+    n = 0
+    shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        n |= (b & 0x7f) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+
+class Container:
+    """A program in the indexed binary format, whose functions are
+    decoded only when they are requested.
+
+    `data` can be any bytes-like object, including an `mmap`. A
+    container acts like a read-only sequence of functions. Every access
+    decodes a fresh copy of the function, so changes to it are not
+    saved.
+    """
+
+    def __init__(self, data):
+        if data[:len(INDEX_MAGIC)] != INDEX_MAGIC:
+            raise ValueError('not an indexed binary Bril program')
+        self.data = data
+
+        pos, = _offset.unpack_from(data, len(INDEX_MAGIC))
+        count, pos = _read_varint(data, pos)
+        self.names = []
+        self._spans = []
+        for _ in range(count):
+            length, pos = _read_varint(data, pos)
+            self.names.append(str(data[pos:pos + length], 'utf-8'))
+            pos += length
+            start, pos = _read_varint(data, pos)
+            length, pos = _read_varint(data, pos)
+            self._spans.append((start, length))
+        start, pos = _read_varint(data, pos)
+        length, pos = _read_varint(data, pos)
+        self._rest_span = (start, length)
+        self._by_name = {}
+        for i, name in enumerate(self.names):
+            self._by_name.setdefault(name, i)
+
+    def _decode(self, span):
+        start, length = span
+        return loads(self.data[start:start + length])
+
+    def __len__(self):
+        return len(self._spans)
+
+    def __getitem__(self, i):
+        return self._decode(self._spans[i])
+
+    def __iter__(self):
+        for span in self._spans:
+            yield self._decode(span)
+
+    def function(self, name):
+        """Decode the function called `name`."""
+        return self._decode(self._spans[self._by_name[name]])
+
+    def program(self, lazy=False):
+        """Decode the program. With `lazy`, its `functions` is this
+        container, so functions are decoded only as they are used.
+        """
+        prog = self._decode(self._rest_span)
+        prog['functions'] = self if lazy else list(self)
+        return prog
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+
+def open_container(path):
+    """Memory-map an indexed binary program from a file."""
+    with open(path, 'rb') as f:
+        return Container(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def loads(data, lazy=False):
+    """Decode a Bril program from any bytes-like object.
+
+    For programs in the indexed format, `lazy` makes the program's
+    `functions` a `Container` that decodes functions only on demand.
+    """
+    if data[:len(INDEX_MAGIC)] == INDEX_MAGIC:
+        return Container(data).program(lazy)
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError('not a binary Bril program')
+    pos = len(MAGIC)
+
+    # Bind everything the decoder touches to locals for speed.
+    unpack_double = _double.unpack_from
+
+    def varint():
+        nonlocal pos
+        b = data[pos]
+        pos += 1
+        if b < 0x80:
+            return b
+        n = b & 0x7f
+        shift = 7
+        while True:
+            b = data[pos]
+            pos += 1
+            n |= (b & 0x7f) << shift
+            if b < 0x80:
+                return n
+            shift += 7
+
+    # Read the string table.
+    strings = []
+    for _ in range(varint()):
+        length = varint()
+        strings.append(str(data[pos:pos + length], 'utf-8'))
+        pos += length
+
+    def value():
+        nonlocal pos
+        tag = data[pos]
+        pos += 1
+        if tag == STR:
+            return strings[varint()]
+        elif tag == DICT:
+            out = {}
+            for _ in range(varint()):
+                key = strings[varint()]
+                out[key] = value()
+            return out
+        elif tag == LIST:
+            return [value() for _ in range(varint())]
+        elif tag == INT:
+            return varint()
+        elif tag == NEG_INT:
+            return -varint()
+        elif tag == TRUE:
+            return True
+        elif tag == FALSE:
+            return False
+        elif tag == NULL:
+            return None
+        elif tag == FLOAT:
+            val, = unpack_double(data, pos)
+            pos += 8
+            return val
+        else:
+            raise ValueError('unknown tag {} at byte {}'.format(tag, pos - 1))
+
+    return value()
+
+
+def load(fp, lazy=False):
+    """Read a Bril program from the binary file-like object `fp`."""
+    # Through a memoryview, a `Container` slices out functions without
+    # copying them.
+    return loads(memoryview(fp.read()), lazy)
+
+
+def load_any(fp, lazy=False):
+    """Read a Bril program in either the binary or the JSON format from
+    the binary file-like object `fp`.
+    """
+    data = fp.read()
+    if is_binary(data):
+        return loads(data, lazy)
+    else:
+        return json.loads(data)
+
+
+# Command-line entry points.
+
+def bril2bin():
+    if '-i' in sys.argv[1:]:
+        dump_indexed(json.load(sys.stdin), sys.stdout.buffer)
+    else:
+        dump(json.load(sys.stdin), sys.stdout.buffer)
+
+
+def bin2bril():
+    json.dump(load(sys.stdin.buffer), sys.stdout, indent=2, sort_keys=True)
+    print()
@@ -44,20 +44,15 @@ class Dominators:
 
 
 
-        # Compute the dominance tree
+        # Compute the dominance tree. The strict dominators of a block form a
+        # chain, so the immediate dominator is the one that is itself
+        # dominated by the most blocks.
         dt_parent = [None]
 
         for i in range(1, g.n):
-            for j in self.doms[i]:
-                if i != j:  # j strictly dominates i
-                    immed_dom = True
-                    for k in range(g.n):
-                        if k != j and k != i and j in self.doms[k] and k in self.doms[i]:
-                            immed_dom = False
-                            break
-                    if immed_dom:
-                        dt_parent.append(j)
-                        break
+            strict = [j for j in self.doms[i] if j != i]
+            dt_parent.append(max(strict, key=lambda j: len(self.doms[j]),
+                                 default=None))
 
         self.dom_tree = {}
         for i,p in enumerate(dt_parent):
@@ -0,0 +1,53 @@
+"""Measure pretty-printer throughput on the `benchmarks/long` programs.
+
+Each program's functions are repeated until the program is large enough
+to time reliably, then printed both line by line with `print()` (the way
+`bril2txt` used to work) and with `dump_prog`. Run it from anywhere:
+
+    $ python bril-txt/bench.py [COPIES]
+"""
+
+import contextlib
+import glob
+import os
+import sys
+import time
+
+import briltxt
+
+LONG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        '..', 'benchmarks', 'long')
+
+
+def print_lines(prog):
+    """Print a program one `print()` call per line."""
+    for func in prog['functions']:
+        for line in briltxt.func_lines(func):
+            print(line)
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def bench(copies):
+    for path in sorted(glob.glob(os.path.join(LONG_DIR, '*.bril'))):
+        with open(path) as f:
+            prog = briltxt.parse_prog(f.read())
+        prog['functions'] = prog['functions'] * copies
+        ninstrs = sum(len(f['instrs']) for f in prog['functions'])
+
+        with open(os.devnull, 'w') as null:
+            with contextlib.redirect_stdout(null):
+                t_print = timed(print_lines, prog)
+            t_dump = timed(briltxt.dump_prog, prog, null)
+
+        print('{}: {} instrs, print {:.0f}/s, dump_prog {:.0f}/s, {:.2f}x'
+              .format(os.path.basename(path), ninstrs,
+                      ninstrs / t_print, ninstrs / t_dump, t_print / t_dump))
+
+
+if __name__ == '__main__':
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -9,7 +9,18 @@ format and emits the ordinary JSON representation.
 
 import lark
 import sys
+import io
+import os
+import re
 import json
+import glob
+import argparse
+import concurrent.futures
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 __version__ = '0.0.1'
 
@@ -22,15 +33,15 @@ start: (struct | func)*
 struct: STRUCT IDENT "=" "{" mbr* "}"
 mbr: IDENT ":" type ";"
 
-func: FUNC ["(" arg_list? ")"] [tyann] "{" instr* "}"
-arg_list: | arg ("," arg)*
+func: FUNC ["(" arg_list ")"] [tyann] "{" instr* "}"
+arg_list: (arg ("," arg)*)?
 arg: IDENT ":" type
 ?instr: const | vop | eop | label
 
-const.4: IDENT [tyann] "=" "const" lit ";"
-vop.3: IDENT [tyann] "=" op ";"
-eop.2: op ";"
-label.1: LABEL ":"
+const: IDENT [tyann] "=" "const" lit ";"
+vop: IDENT [tyann] "=" op ";"
+eop: op ";"
+label: LABEL ":"
 
 op: IDENT (FUNC | LABEL | IDENT)*
 
@@ -117,7 +128,7 @@ class JSONTransformer(lark.Transformer):
         name = items.pop(0)
         typ = items.pop(0)
         return {
-            'name': name,
+            'name': str(name),
             'type': typ,
         }
 
@@ -125,7 +136,7 @@ class JSONTransformer(lark.Transformer):
         name = items[1]
         mbrs = items[2:]
         return {
-            'name': name,
+            'name': str(name),
             'mbrs': mbrs,
         }
 
@@ -133,7 +144,7 @@ class JSONTransformer(lark.Transformer):
         name = items.pop(0)
         typ = items.pop(0)
         return {
-            'name': name,
+            'name': str(name),
             'type': typ,
         }
 
@@ -212,7 +223,7 @@ class JSONTransformer(lark.Transformer):
             return False
 
     def paramtype(self, items):
-        return {items[0]: items[1]}
+        return {str(items[0]): items[1]}
 
     def primtype(self, items):
         return str(items[0])
@@ -230,15 +241,170 @@ class JSONTransformer(lark.Transformer):
         return value
 
 
-def parse_bril(txt, include_pos=False):
+_parser = None
+
+
+def get_parser():
+    """Get the shared LALR parser for the text format.
+
+    The parser is built on first use and reused afterward. Set the
+    `BRILTXT_CACHE` environment variable to a filename to store the
+    compiled parser tables on disk (or to `1` to let Lark choose a
+    temporary file), which also avoids the grammar analysis on startup.
+    """
+    global _parser
+    if _parser is None:
+        cache = os.environ.get('BRILTXT_CACHE') or False
+        if cache == '1':
+            cache = True
+        _parser = lark.Lark(GRAMMAR, parser='lalr', maybe_placeholders=True,
+                            cache=cache)
+    return _parser
+
+
+def parse_prog(txt, include_pos=False):
+    """Parse a Bril program and return it as a JSON-like Python dict.
+
+    In-process callers should prefer this to `parse_bril` to avoid
+    serializing JSON only to parse it again. Optionally include source
+    position information.
+    """
+    tree = get_parser().parse(txt)
+    return JSONTransformer(include_pos).transform(tree)
+
+
+def dumps_json(data, compact=False):
+    """Serialize a Bril program to a JSON string.
+
+    The default is the canonical, indented format with sorted keys. In
+    `compact` mode, skip the whitespace and key sorting and use `orjson`
+    if it is installed.
+    """
+    if not compact:
+        return json.dumps(data, indent=2, sort_keys=True)
+    if orjson is not None:
+        try:
+            return orjson.dumps(data).decode('utf-8')
+        except TypeError:
+            # `orjson` rejects some values the `json` module accepts,
+            # like integers that don't fit in 64 bits.
+            pass
+    return json.dumps(data, separators=(',', ':'))
+
+
+def parse_bril(txt, include_pos=False, compact=False):
     """Parse a Bril program and return a JSON string.
 
-    Optionally include source position information.
+    Optionally include source position information. In `compact` mode,
+    produce smaller (but less readable) JSON faster.
     """
-    parser = lark.Lark(GRAMMAR, maybe_placeholders=True)
-    tree = parser.parse(txt)
-    data = JSONTransformer(include_pos).transform(tree)
-    return json.dumps(data, indent=2, sort_keys=True)
+    return dumps_json(parse_prog(txt, include_pos), compact)
+
+
+# Incremental parsing.
+
+# The tokens that matter for finding top-level braces. Comments and
+# character literals are matched so that braces inside them are skipped.
+_CHUNK_TOKENS = re.compile(r"#[^\n]*|'\\[0abtnvfr]'|'.'|[{}]")
+
+
+def split_chunks(txt):
+    """Split program text into chunks that each contain at most one
+    top-level struct or function, ending with its closing brace.
+
+    Whitespace and comments between definitions belong to the following
+    chunk; anything after the last closing brace is a final chunk. The
+    chunks concatenate back to `txt`.
+    """
+    depth = 0
+    start = 0
+    for match in _CHUNK_TOKENS.finditer(txt):
+        tok = match.group()
+        if tok == '{':
+            depth += 1
+        elif tok == '}':
+            depth -= 1
+            if depth <= 0:
+                depth = 0
+                yield txt[start:match.end()]
+                start = match.end()
+    if start < len(txt):
+        yield txt[start:]
+
+
+def _shift_pos(item, row, col):
+    """Copy a parsed item, moving source positions from a chunk starting
+    at `row` and `col` into whole-file coordinates.
+    """
+    pos = item['pos']
+    return dict(item, pos={
+        'row': pos['row'] + row - 1,
+        'col': pos['col'] + col - 1 if pos['row'] == 1 else pos['col'],
+    })
+
+
+class IncrementalParser:
+    """Parse successive versions of a program, reusing work from the
+    previous version.
+
+    The text is split into one chunk per struct or function, and each
+    chunk's parse is remembered by its text, so only chunks that changed
+    since the last call are parsed again. The returned programs share
+    data with this cache, so copy them before modifying them.
+    """
+
+    def __init__(self, include_pos=False):
+        self.include_pos = include_pos
+        self._chunks = {}
+
+    def _parse_chunk(self, chunk):
+        if chunk in self._chunks:
+            return self._chunks[chunk]
+        data = parse_prog(chunk, self.include_pos)
+        return data.get('structs', []), data['functions']
+
+    def parse(self, txt):
+        """Parse a Bril program and return it as a dict, like
+        `parse_prog`.
+        """
+        chunks = {}
+        structs = []
+        funcs = []
+        row, col = 1, 1
+        try:
+            for chunk in split_chunks(txt):
+                chunk_structs, chunk_funcs = chunks[chunk] = \
+                    self._parse_chunk(chunk)
+                structs += chunk_structs
+                if self.include_pos and (row, col) != (1, 1):
+                    chunk_funcs = [
+                        dict(_shift_pos(func, row, col), instrs=[
+                            _shift_pos(instr, row, col)
+                            for instr in func['instrs']
+                        ])
+                        for func in chunk_funcs
+                    ]
+                funcs += chunk_funcs
+
+                # Advance to the start of the next chunk.
+                newlines = chunk.count('\n')
+                if newlines:
+                    row += newlines
+                    col = len(chunk) - chunk.rfind('\n')
+                else:
+                    col += len(chunk)
+        except lark.exceptions.LarkError:
+            # Parse everything so the error has whole-file positions.
+            parse_prog(txt, self.include_pos)
+            raise
+
+        # Forget chunks that no longer appear in the program.
+        self._chunks = chunks
+
+        if structs:
+            return {'structs': structs, 'functions': funcs}
+        else:
+            return {'functions': funcs}
 
 
 # Text format pretty-printer.
@@ -252,55 +418,45 @@ def type_to_str(type):
         return type
 
 
+control_chars_reverse = {y: x for x, y in control_chars.items()}
+
+
 def value_to_str(type, value):
     if not isinstance(type, dict) and type.lower() == "char":
-        control_chars_reverse = {y: x for x, y in control_chars.items()}
         if ord(value) in control_chars_reverse:
             value = control_chars_reverse[ord(value)]
-        return "'{}'".format(value)
+        return "'" + value + "'"
     else:
         return str(value).lower()
 
 
 def instr_to_string(instr):
-    if instr['op'] == 'const':
-        tyann = ': {}'.format(type_to_str(instr['type'])) \
-            if 'type' in instr else ''
-        return '{}{} = const {}'.format(
-            instr['dest'],
-            tyann,
-            value_to_str(instr['type'], instr['value']),
-        )
+    if 'type' in instr:
+        tyann = ': ' + type_to_str(instr['type'])
     else:
-        rhs = instr['op']
-        if instr.get('funcs'):
-            rhs += ' {}'.format(' '.join(
-                '@{}'.format(f) for f in instr['funcs']
-            ))
-        if instr.get('args'):
-            rhs += ' {}'.format(' '.join(instr['args']))
-        if instr.get('labels'):
-            rhs += ' {}'.format(' '.join(
-                '.{}'.format(f) for f in instr['labels']
-            ))
-        if 'dest' in instr:
-            tyann = ': {}'.format(type_to_str(instr['type'])) \
-                if 'type' in instr else ''
-            return '{}{} = {}'.format(
-                instr['dest'],
-                tyann,
-                rhs,
-            )
-        else:
-            return rhs
-
-
-def print_instr(instr):
-    print('  {};'.format(instr_to_string(instr)))
-
+        tyann = ''
 
-def print_label(label):
-    print('.{}:'.format(label['label']))
+    if instr['op'] == 'const':
+        return instr['dest'] + tyann + ' = const ' + \
+            value_to_str(instr['type'], instr['value'])
+
+    # Collect the pieces of the right-hand side and join them once.
+    parts = [instr['op']]
+    funcs = instr.get('funcs')
+    if funcs:
+        parts.extend('@' + f for f in funcs)
+    args = instr.get('args')
+    if args:
+        parts.extend(args)
+    labels = instr.get('labels')
+    if labels:
+        parts.extend('.' + f for f in labels)
+    rhs = ' '.join(parts)
+
+    if 'dest' in instr:
+        return instr['dest'] + tyann + ' = ' + rhs
+    else:
+        return rhs
 
 
 def args_to_string(args):
@@ -313,31 +469,269 @@ def args_to_string(args):
         return ''
 
 
-def print_func(func):
+def func_lines(func):
+    """Generate the lines of text for a function, without newlines.
+    """
     typ = func.get('type', 'void')
-    print('@{}{}{} {{'.format(
+    yield '@{}{}{} {{'.format(
         func['name'],
         args_to_string(func.get('args', [])),
         ': {}'.format(type_to_str(typ)) if typ != 'void' else '',
-    ))
+    )
     for instr_or_label in func['instrs']:
         if 'label' in instr_or_label:
-            print_label(instr_or_label)
+            yield '.' + instr_or_label['label'] + ':'
         else:
-            print_instr(instr_or_label)
-    print('}')
+            yield '  ' + instr_to_string(instr_or_label) + ';'
+    yield '}'
+
+
+def dump_func(func, fp):
+    """Write the text for a function to the file-like object `fp` with a
+    single `write` call.
+    """
+    lines = list(func_lines(func))
+    lines.append('')  # Trailing newline.
+    fp.write('\n'.join(lines))
+
+
+def dump_prog(prog, fp):
+    """Pretty-print a program to the file-like object `fp`.
+
+    `prog` may be a program (a dict with a `functions` list) or any
+    iterable of functions. Functions are rendered and written one at a
+    time, so an iterator of functions can be printed without holding the
+    whole program in memory.
+    """
+    funcs = prog['functions'] if isinstance(prog, dict) else prog
+    for func in funcs:
+        dump_func(func, fp)
+
+
+def print_instr(instr):
+    print('  {};'.format(instr_to_string(instr)))
+
+
+def print_label(label):
+    print('.{}:'.format(label['label']))
+
+
+def print_func(func):
+    dump_func(func, sys.stdout)
 
 
 def print_prog(prog):
-    for func in prog['functions']:
-        print_func(func)
+    dump_prog(prog, sys.stdout)
+
+
+# Batch conversion.
+
+# Output extensions for each kind of input file.
+CONVERSIONS = {
+    '.bril': '.json',
+    '.json': '.bril',
+}
+
+# The input extension for each `--to` direction.
+DIRECTIONS = {
+    'json': '.bril',
+    'txt': '.json',
+}
+
+
+def output_path(path, out_dir=None, root=None):
+    """Get the path that `convert_file` writes for an input file.
+
+    The output goes next to the input, with the other extension, or into
+    `out_dir` if it is given. With a `root` directory too, the input's
+    path relative to `root` is kept under `out_dir`.
+    """
+    base, ext = os.path.splitext(path)
+    out_path = base + CONVERSIONS[ext]
+    if out_dir is not None:
+        if root is None:
+            out_path = os.path.basename(out_path)
+        else:
+            out_path = os.path.relpath(out_path, root)
+        out_path = os.path.join(out_dir, out_path)
+    return out_path
+
+
+def convert_file(path, out_dir=None, include_pos=False, compact=False,
+                 root=None):
+    """Convert a single file between the text and JSON formats.
+
+    The direction is chosen by the file's extension: `.bril` files are
+    parsed to JSON and `.json` files are pretty-printed as text. The
+    output path comes from `output_path`. `include_pos` and `compact`
+    are passed along to `parse_bril`. Return the output path.
+
+    The whole output is produced before the file is opened, so a file
+    that fails to convert leaves nothing behind.
+    """
+    ext = os.path.splitext(path)[1]
+    out_path = output_path(path, out_dir, root)
+
+    with open(path) as f:
+        if ext == '.bril':
+            out = parse_bril(f.read(), include_pos, compact) + '\n'
+        else:
+            buf = io.StringIO()
+            dump_prog(json.load(f), buf)
+            out = buf.getvalue()
+
+    parent = os.path.dirname(out_path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+    with open(out_path, 'w') as f:
+        f.write(out)
+    return out_path
+
+
+def expand_paths(patterns, to=None):
+    """Expand a list of paths, glob patterns, and directories into a
+    sorted list of convertible files. Directories contribute all the
+    `.bril` and `.json` files they contain. With `to` (`'json'` or
+    `'txt'`), keep only the files that convert to that format.
+    """
+    exts = [DIRECTIONS[to]] if to is not None else list(CONVERSIONS)
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for ext in exts:
+                paths.update(glob.glob(os.path.join(pattern, '*' + ext)))
+        else:
+            paths.update(p for p in glob.glob(pattern, recursive=True)
+                         if os.path.splitext(p)[1] in exts)
+    return sorted(paths)
+
+
+def plan_conversions(paths, out_dir=None, root=None):
+    """Check that a batch of conversions is safe to run.
+
+    Return the inputs to convert and the inputs to skip because their
+    output would overwrite another input in the batch (like a `foo.bril`
+    next to its `foo.json`). Raise a `ValueError` if two inputs would
+    write the same output, or if an input is outside `root`.
+    """
+    inputs = {os.path.realpath(p) for p in paths}
+    outputs = {}
+    todo = []
+    skipped = []
+    for path in paths:
+        if root is not None and \
+                os.path.relpath(path, root).startswith(os.pardir):
+            raise ValueError('{} is not under {}'.format(path, root))
+        out = os.path.realpath(output_path(path, out_dir, root))
+        if out in inputs:
+            skipped.append(path)
+        elif out in outputs:
+            raise ValueError('{} and {} would both be written to {}'.format(
+                outputs[out], path, output_path(path, out_dir, root),
+            ))
+        else:
+            outputs[out] = path
+            todo.append(path)
+    return todo, skipped
+
+
+def _try_convert(path, out_dir, include_pos, compact, root):
+    """Convert a file, returning the output path and `None`, or `None`
+    and an error message if the conversion failed.
+    """
+    try:
+        return convert_file(path, out_dir, include_pos, compact, root), None
+    except Exception as exc:
+        # Some messages (like lark's) go on for several lines.
+        message = str(exc).strip().split('\n')[0]
+        return None, '{}: {}'.format(type(exc).__name__, message)
+
+
+def convert_files(paths, out_dir=None, include_pos=False, compact=False,
+                  jobs=1, root=None):
+    """Convert many files in this process, sharing a single parser.
+
+    With `jobs` greater than one, spread the files across a pool of
+    worker processes instead. Generate `(input, output, error)` triples
+    as the conversions finish. For a file that could not be converted,
+    `output` is `None` and `error` describes the problem; one bad file
+    does not stop the rest.
+    """
+    if jobs > 1:
+        with concurrent.futures.ProcessPoolExecutor(jobs) as pool:
+            futures = {
+                pool.submit(_try_convert, path, out_dir, include_pos,
+                            compact, root): path
+                for path in paths
+            }
+            for future in concurrent.futures.as_completed(futures):
+                yield (futures[future],) + future.result()
+    else:
+        for path in paths:
+            yield (path,) + _try_convert(path, out_dir, include_pos,
+                                         compact, root)
 
 
 # Command-line entry points.
 
 def bril2json():
-    print(parse_bril(sys.stdin.read(), '-p' in sys.argv[1:]))
+    print(parse_bril(sys.stdin.read(), '-p' in sys.argv[1:],
+                     '-c' in sys.argv[1:]))
 
 
 def bril2txt():
-    print_prog(json.load(sys.stdin))
+    dump_prog(json.load(sys.stdin), sys.stdout)
+
+
+def brilbatch():
+    parser = argparse.ArgumentParser(
+        description='Convert many Bril files between the text and JSON '
+                    'formats in one process.',
+    )
+    parser.add_argument('paths', nargs='+', metavar='PATH',
+                        help='.bril or .json files, glob patterns, or '
+                             'directories')
+    parser.add_argument('-o', '--out-dir', metavar='DIR',
+                        help='write outputs here instead of next to the '
+                             'inputs')
+    parser.add_argument('-r', '--root', metavar='ROOT',
+                        help='with -o, keep each input\'s path relative '
+                             'to ROOT under DIR')
+    parser.add_argument('-t', '--to', choices=sorted(DIRECTIONS),
+                        help='only convert to this format (by default, '
+                             'both directions are converted)')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='number of worker processes')
+    parser.add_argument('-p', '--pos', action='store_true',
+                        help='include source positions in JSON output')
+    parser.add_argument('-c', '--compact', action='store_true',
+                        help='write compact JSON output')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='print each conversion')
+    args = parser.parse_args()
+    if args.root is not None and args.out_dir is None:
+        parser.error('--root requires --out-dir')
+
+    paths = expand_paths(args.paths, args.to)
+    try:
+        paths, skipped = plan_conversions(paths, args.out_dir, args.root)
+    except ValueError as exc:
+        parser.error('{} (use --root to keep directories apart)'.format(exc))
+    for path in skipped:
+        print('skipping {}: its output is also an input (use --to to pick '
+              'a direction)'.format(path), file=sys.stderr)
+
+    if args.out_dir is not None:
+        os.makedirs(args.out_dir, exist_ok=True)
+
+    failed = False
+    for src, dest, error in convert_files(paths, args.out_dir, args.pos,
+                                          args.compact, args.jobs,
+                                          args.root):
+        if error is not None:
+            print('{}: {}'.format(src, error), file=sys.stderr)
+            failed = True
+        elif args.verbose:
+            print('{} -> {}'.format(src, dest), file=sys.stderr)
+    if failed:
+        sys.exit(1)
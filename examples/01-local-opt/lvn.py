@@ -1,18 +1,85 @@
 # Local Value Numbering
+import heapq
 import json
 import sys
 import cfg
 from collections import OrderedDict
 
-def reverse_lookup(dict, value):
-    for k, v in dict.items():
-        if v == value:
-            return k
-    return None
+def expr_key(expr):
+    # (op, args) expressions hold their args in a list, so turn that into
+    # a tuple to hash them
+    op, args = expr
+    return (op, None if args is None else tuple(args))
+
+class ValueTable:
+    """
+    Maps each dst to its (op, args) expression, like a plain dict, but also
+    indexes the dsts by expression, so finding the dst that holds an
+    expression does not have to scan every entry.
+    """
+    def __init__(self):
+        # key: dst, value: op, args
+        self.exprs : OrderedDict = OrderedDict()
+        # key: dst, value: its position in exprs (new dsts go at the end;
+        # assigning to an old one keeps its place)
+        self.order : dict = {}
+        # key: hashable expr, value: heap of (position, dst) for the dsts
+        # that have held that expr. Entries for dsts that have been
+        # reassigned since are only thrown away once they reach the top.
+        self.index : dict = {}
+        # key: dst of an id, value: the end of its chain of ids
+        self.shortcuts : dict = {}
+
+    def __contains__(self, dst):
+        return dst in self.exprs
+
+    def __getitem__(self, dst):
+        return self.exprs[dst]
+
+    def __setitem__(self, dst, expr):
+        if dst in self.exprs:
+            # an id chain may run through the old value. (every id points
+            # at a dst that is already in the table, so new dsts can't
+            # change any chain)
+            self.shortcuts.clear()
+        else:
+            self.order[dst] = len(self.order)
+        self.exprs[dst] = expr
+        heap = self.index.setdefault(expr_key(expr), [])
+        heapq.heappush(heap, (self.order[dst], dst))
+
+    def lookup(self, expr):
+        # the first dst (in table order) that holds expr, or None
+        key = expr_key(expr)
+        heap = self.index.get(key, [])
+        while heap:
+            _, dst = heap[0]
+            if expr_key(self.exprs[dst]) == key:
+                return dst
+            heapq.heappop(heap)
+        return None
+
+    def resolve(self, arg):
+        # follow the chain of ids starting at arg to its end, and remember
+        # the end for every id on the way
+        path = []
+        while arg in self.exprs and self.exprs[arg][0] == "id":
+            if arg in self.shortcuts:
+                arg = self.shortcuts[arg]
+                break
+            next_arg = self.exprs[arg][1][0]
+            if next_arg == arg:
+                # a swap like `a = id b; b = id a` leaves b as an id of
+                # itself, which is where the chain ends
+                break
+            path.append(arg)
+            arg = next_arg
+        for dst in path:
+            self.shortcuts[dst] = arg
+        return arg
 
 def lvn(block):
-    # key: dst, value: op, args
-    lvn_blob_map = OrderedDict()
+    lvn_blob_map = ValueTable()
     # first pass: collect all the args, populate lvn dictionary
     # mark common subexprs as ids
     for insn in block.instrs:
@@ -21,15 +88,14 @@ def lvn(block):
             # collect all args
             for i, arg in enumerate(insn["args"]):
                 original_arg = arg
-                while arg in lvn_blob_map and lvn_blob_map[arg][0] == "id":
-                    arg = lvn_blob_map[arg][1][0]
-                
+                arg = lvn_blob_map.resolve(arg)
+
                 if arg != original_arg:
                     log_file.write(f"Found an arg common_subexpr: {original_arg} -> {arg}\n")
                     insn["args"][i] = arg
 
                 args.append(arg)
-                
+
                 if arg not in lvn_blob_map:
                     lvn_blob_map[arg] = ("uninferable", None)
                     log_file.write(f"found uninferable: {arg}\n")
@@ -37,11 +103,12 @@ def lvn(block):
         if "dest" in insn:
             subexpr = (insn["op"], args)
             log_file.write(f"Subexpr: {subexpr}\n")
-            if insn["op"] == "const" or insn["op"] == "id" or subexpr not in lvn_blob_map.values():
+            key = None
+            if insn["op"] != "const" and insn["op"] != "id":
+                key = lvn_blob_map.lookup(subexpr)
+            if key is None:
                 lvn_blob_map[insn["dest"]] = subexpr
             else:
-                # reverse lookup
-                key = reverse_lookup(lvn_blob_map, subexpr)
                 log_file.write(f"Found a match: {subexpr}\n")
                 lvn_blob_map[insn["dest"]] = ("id", [key])
                 insn.update({
@@ -61,4 +128,3 @@ if __name__ == "__main__":
             lvn(block)
         fn["instrs"] = cfg.cfg_to_instrs(local_cfg)
     json.dump(prog, sys.stdout, indent=2)
-                    
\ No newline at end of file
@@ -7,7 +7,7 @@ import cfg
 import ssa
 import networkx as nx
 
-invar_ops = ["add", "sub", "mul", "div", "mod", "eq", "lt", "gt", "le", "ge"]
+invar_ops = {"add", "sub", "mul", "div", "mod", "eq", "lt", "gt", "le", "ge"}
 
 class Loop:
     def __init__(self, backedge: tuple[cfg.BasicBlock, cfg.BasicBlock], loop_body: set[cfg.BasicBlock]):
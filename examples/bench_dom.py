@@ -0,0 +1,106 @@
+"""Measure how the dominator computations scale on large generated CFGs.
+
+For each size, generate a few kinds of CFGs and report how long it
+takes to find the immediate dominators (`get_idoms`) and to derive the
+dominator tree and dominance frontiers from them. The simple iterative
+algorithm (`get_dom_iterative`) computes the full dominator sets, which
+take quadratic space, so it is only measured on graphs up to
+`SET_LIMIT` blocks.
+
+    $ python bench_dom.py [MAX_BLOCKS]
+"""
+
+import random
+import sys
+import time
+
+import dom
+
+SIZES = [1000, 10000, 30000, 100000]
+SET_LIMIT = 1000
+
+
+def chain(n):
+    """A long chain of if-then-else diamonds: a very deep dominator tree.
+    """
+    succ = {}
+    for i in range(0, n - 3, 3):
+        succ['b{}'.format(i)] = ['b{}'.format(i + 1), 'b{}'.format(i + 2)]
+        succ['b{}'.format(i + 1)] = ['b{}'.format(i + 3)]
+        succ['b{}'.format(i + 2)] = ['b{}'.format(i + 3)]
+    succ['b{}'.format(len(succ))] = []
+    return succ
+
+
+def nested_loops(n, depth=50):
+    """A sequence of loop nests, each `depth` loops deep, where the
+    latch of every loop jumps back to its header.
+    """
+    succ = {'entry': ['n0h0']}
+    nest = 0
+    while len(succ) + 2 * depth < n:
+        for i in range(depth):
+            succ['n{}h{}'.format(nest, i)] = ['n{}h{}'.format(nest, i + 1)]
+            succ['n{}t{}'.format(nest, i)] = ['n{}h{}'.format(nest, i),
+                                              'n{}t{}'.format(nest, i - 1)]
+        succ['n{}h{}'.format(nest, depth)] = ['n{}t{}'.format(nest, depth - 1)]
+        succ['n{}t0'.format(nest)] = ['n{}h0'.format(nest),
+                                      'n{}h0'.format(nest + 1)]
+        nest += 1
+    succ['n{}h0'.format(nest)] = []
+    return succ
+
+
+def random_cfg(n, seed=0):
+    """Blocks that fall through to the next block and sometimes branch
+    to a random other block, making lots of irregular loops.
+    """
+    rand = random.Random(seed)
+    succ = {}
+    for i in range(n):
+        out = ['b{}'.format(i + 1)] if i + 1 < n else []
+        if i and rand.random() < 0.5:
+            out.append('b{}'.format(rand.randrange(1, n)))
+        succ['b{}'.format(i)] = out
+    return succ
+
+
+SHAPES = {
+    'chain': chain,
+    'loops': nested_loops,
+    'random': random_cfg,
+}
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def bench(max_blocks):
+    for n in SIZES:
+        if n > max_blocks:
+            break
+        for shape, make in SHAPES.items():
+            succ = make(n)
+            entry = next(iter(succ))
+
+            doms = dom.Dominators(succ, entry)
+            times = [
+                ('idoms', timed(dom.get_idoms, succ, entry)),
+                ('tree', timed(lambda: doms.tree)),
+                ('fronts', timed(lambda: doms.fronts)),
+            ]
+            if n <= SET_LIMIT:
+                times.append(('iterative',
+                              timed(dom.get_dom_iterative, succ, entry)))
+
+            print('{:7} {:7} {}'.format(
+                len(succ), shape,
+                '  '.join('{} {:.3f}s'.format(k, v) for k, v in times),
+            ))
+
+
+if __name__ == '__main__':
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else max(SIZES))
@@ -0,0 +1,67 @@
+"""Compare dict instructions with `Instr` objects on the benchmark suite.
+
+For each representation, load every program in `benchmarks/` (repeated
+a few times to make the numbers stable), then report the memory the
+instructions take and the time `tdce` and `lvn` take to run on them.
+
+    $ python bench_instr.py [COPIES]
+"""
+
+import copy
+import glob
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import briltxt
+import lvn
+import tdce
+from instr import to_instrs
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         '..', 'benchmarks')
+
+
+def load_suite(copies):
+    """Parse the benchmark programs and serialize them as one big JSON
+    program, so each representation can be loaded fresh.
+    """
+    funcs = []
+    for path in sorted(glob.glob(os.path.join(BENCH_DIR, '*', '*.bril'))):
+        with open(path) as f:
+            funcs += briltxt.parse_prog(f.read())['functions']
+    return json.dumps({'functions': funcs * copies})
+
+
+def measure(text, convert):
+    tracemalloc.start()
+    bril = convert(json.loads(text))
+    mem = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    times = {}
+    for name, run in [
+        ('tdce', lambda b: [tdce.trivial_dce_plus(f) for f in b['functions']]),
+        ('lvn', lambda b: lvn.lvn(b, True, True, True)),
+    ]:
+        prog = copy.deepcopy(bril)
+        start = time.perf_counter()
+        run(prog)
+        times[name] = time.perf_counter() - start
+    return mem, times
+
+
+def bench(copies):
+    text = load_suite(copies)
+    for name, convert in [('dict', lambda b: b), ('Instr', to_instrs)]:
+        mem, times = measure(text, convert)
+        print('{:6} {:6.1f} MB  {}'.format(
+            name, mem / 2**20,
+            '  '.join('{} {:.3f}s'.format(k, v) for k, v in times.items()),
+        ))
+
+
+if __name__ == '__main__':
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
@@ -102,6 +102,28 @@ def edges(blocks):
     return preds, succs
 
 
+def postorder(succs, root):
+    """List the nodes reachable from `root` in a graph, given as a
+    successor map, in depth-first postorder.
+    """
+    # Use an explicit stack rather than recursion, so this works for
+    # graphs of any depth.
+    out = []
+    explored = {root}
+    stack = [(root, iter(succs[root]))]
+    while stack:
+        node, children = stack[-1]
+        for s in children:
+            if s not in explored:
+                explored.add(s)
+                stack.append((s, iter(succs[s])))
+                break
+        else:
+            stack.pop()
+            out.append(node)
+    return out
+
+
 def reassemble(blocks):
     """Flatten a CFG into an instruction list."""
     # This could optimize slightly by opportunistically eliminating
@@ -2,10 +2,9 @@
 emit a GraphViz file.
 """
 
-from form_blocks import form_blocks
-import json
 import sys
-from cfg import block_map, successors, add_terminators
+from function import Function
+from util import load_bril
 
 def cfg_dot(bril, verbose):
     """Generate a GraphViz "dot" file showing the control flow graph for
@@ -16,10 +15,10 @@ def cfg_dot(bril, verbose):
     for func in bril['functions']:
         print('digraph {} {{'.format(func['name']))
 
-        blocks = block_map(form_blocks(func['instrs']))
-
-        # Insert terminators into blocks that don't have them.
-        add_terminators(blocks)
+        # Form the blocks, with terminators inserted into blocks that
+        # don't have them.
+        graph = Function.of(func).cfg()
+        blocks = graph.blocks
 
         # Add the vertices.
         for name, block in blocks.items():
@@ -34,9 +33,8 @@ def cfg_dot(bril, verbose):
                 print('  {};'.format(name))
 
         # Add the control-flow edges.
-        for i, (name, block) in enumerate(blocks.items()):
-            succ = successors(block[-1])
-            for label in succ:
+        for name in blocks:
+            for label in graph.succs[name]:
                 print('  {} -> {};'.format(quote_if_needed(name), quote_if_needed(label)))
 
         print('}')
@@ -47,4 +45,4 @@ def quote_if_needed(s):
     return '"' + s + '"'
 
 if __name__ == '__main__':
-    cfg_dot(json.load(sys.stdin), '-v' in sys.argv[1:])
+    cfg_dot(load_bril(lazy=True), '-v' in sys.argv[1:])
@@ -1,8 +1,10 @@
+import heapq
 import sys
-import json
 from collections import namedtuple
 
-from form_blocks import form_blocks
+import instrument
+from function import Function
+from util import load_bril
 import cfg
 
 # A single dataflow analysis consists of these part:
@@ -10,7 +12,12 @@ import cfg
 # - init: An initial value (bottom or top of the latice).
 # - merge: Take a list of values and produce a single value.
 # - transfer: The transfer function.
-Analysis = namedtuple('Analysis', ['forward', 'init', 'merge', 'transfer'])
+# - summarize: Optionally, a function that summarizes a block. It is
+#   called once per block, before iterating, and then `transfer` gets
+#   the summary instead of the block itself.
+Analysis = namedtuple('Analysis',
+                      ['forward', 'init', 'merge', 'transfer', 'summarize'],
+                      defaults=[None])
 
 
 def union(sets):
@@ -20,11 +27,18 @@ def union(sets):
     return out
 
 
-def df_worklist(blocks, analysis):
+@instrument.traced(size=instrument.blocks_size)
+def df_worklist(blocks, analysis, edges=None):
     """The worklist algorithm for iterating a data flow analysis to a
     fixed point.
+
+    Pass the `(preds, succs)` edge maps as `edges` if they are already
+    available; otherwise, they are computed from the blocks.
+
+    The number of block visits it took to converge is reported to
+    `instrument` as `iterations`.
     """
-    preds, succs = cfg.edges(blocks)
+    preds, succs = edges or cfg.edges(blocks)
 
     # Switch between directions.
     if analysis.forward:
@@ -36,14 +50,41 @@ def df_worklist(blocks, analysis):
         in_edges = succs
         out_edges = preds
 
+    # Visit blocks in reverse postorder for forward analyses, and in
+    # postorder for backward ones, so (outside of loops) every block
+    # comes after the blocks its input depends on. Unreachable blocks go
+    # at the end.
+    order = cfg.postorder(succs, next(iter(blocks)))
+    if analysis.forward:
+        order.reverse()
+    reached = set(order)
+    order += [node for node in blocks if node not in reached]
+    rank = {node: i for i, node in enumerate(order)}
+
     # Initialize.
+    if analysis.summarize:
+        blocks = {node: analysis.summarize(block)
+                  for node, block in blocks.items()}
     in_ = {first_block: analysis.init}
     out = {node: analysis.init for node in blocks}
 
-    # Iterate.
-    worklist = list(blocks.keys())
-    while worklist:
-        node = worklist.pop(0)
+    # Iterate in rounds. Each round visits the queued blocks in order:
+    # the worklist is a heap of ranks, so it always yields the earliest
+    # one. A block queued along a back edge (to an earlier or the same
+    # rank) waits for the next round rather than restarting this one.
+    # Each block is queued at most once.
+    worklist = list(range(len(order)))  # Already a valid heap.
+    next_round = []
+    queued = [True] * len(order)
+    iterations = 0
+    while worklist or next_round:
+        if not worklist:
+            worklist, next_round = next_round, []
+            heapq.heapify(worklist)
+        i = heapq.heappop(worklist)
+        queued[i] = False
+        node = order[i]
+        iterations += 1
 
         inval = analysis.merge(out[n] for n in in_edges[node])
         in_[node] = inval
@@ -52,7 +93,15 @@ def df_worklist(blocks, analysis):
 
         if outval != out[node]:
             out[node] = outval
-            worklist += out_edges[node]
+            for succ in out_edges[node]:
+                j = rank[succ]
+                if not queued[j]:
+                    queued[j] = True
+                    if j > i:
+                        heapq.heappush(worklist, j)
+                    else:
+                        next_round.append(j)
+    instrument.count('iterations', iterations)
 
     if analysis.forward:
         return in_, out
@@ -79,17 +128,60 @@ def fmt(val):
         return str(val)
 
 
+def print_results(blocks, in_, out):
+    for block in blocks:
+        print('{}:'.format(block))
+        print('  in: ', fmt(in_[block]))
+        print('  out:', fmt(out[block]))
+
+
 def run_df(bril, analysis):
     for func in bril['functions']:
         # Form the CFG.
-        blocks = cfg.block_map(form_blocks(func['instrs']))
-        cfg.add_terminators(blocks)
+        graph = Function.of(func).cfg()
+        blocks = graph.blocks
+
+        in_, out = df_worklist(blocks, analysis, (graph.preds, graph.succs))
+        print_results(blocks, in_, out)
+
+
+def run_df_bits(bril, make_analysis):
+    """Like `run_df`, but for an analysis over bit vectors (see
+    `BIT_ANALYSES`). The results are printed as sets of variables.
+    """
+    for func in bril['functions']:
+        graph = Function.of(func).cfg()
+        blocks = graph.blocks
+        names, index = var_index(blocks)
+
+        in_, out = df_worklist(blocks, make_analysis(index),
+                               (graph.preds, graph.succs))
+        print_results(
+            blocks,
+            {b: from_bits(v, names) for b, v in in_.items()},
+            {b: from_bits(v, names) for b, v in out.items()},
+        )
+
+
+def gen_kill(forward, gen, kill):
+    """Make an analysis over sets of variables where a block's output is
+    `gen(block) | (input - kill(block))`. The gen and kill sets for each
+    block are computed only once.
+    """
+    return Analysis(
+        forward,
+        init=set(),
+        merge=union,
+        transfer=_gen_kill_transfer,
+        summarize=lambda block: (gen(block), kill(block)),
+    )
 
-        in_, out = df_worklist(blocks, analysis)
-        for block in blocks:
-            print('{}:'.format(block))
-            print('  in: ', fmt(in_[block]))
-            print('  out:', fmt(out[block]))
+
+def _gen_kill_transfer(summary, in_):
+    gen, kill = summary
+    out = in_ - kill if kill else set(in_)
+    out |= gen
+    return out
 
 
 def gen(block):
@@ -110,14 +202,102 @@ def use(block):
     return used
 
 
-def cprop_transfer(block, in_vals):
-    out_vals = dict(in_vals)
+# Sets of variables can also be represented as bit vectors: number the
+# variables in a function once, and then a set is a Python int with one
+# bit for every variable in it. Union is bitwise or, difference is "and
+# not," and comparing two values takes a single integer comparison. For
+# functions with many variables, this is much faster than sets of names.
+
+def var_index(blocks):
+    """Number all the variables in the blocks. Return a list of their
+    names, in order, and a map from each name to the bit for it.
+    """
+    names = []
+    index = {}
+    for block in blocks.values():
+        for instr in block:
+            for var in instr.get('args', []):
+                if var not in index:
+                    index[var] = 1 << len(names)
+                    names.append(var)
+            if 'dest' in instr:
+                var = instr['dest']
+                if var not in index:
+                    index[var] = 1 << len(names)
+                    names.append(var)
+    return names, index
+
+
+def from_bits(bits, names):
+    """Convert a bit vector to the set of variables it contains.
+    """
+    out = set()
+    while bits:
+        low = bits & -bits  # Isolate the lowest set bit.
+        out.add(names[low.bit_length() - 1])
+        bits ^= low
+    return out
+
+
+def union_bits(vals):
+    out = 0
+    for v in vals:
+        out |= v
+    return out
+
+
+def gen_bits(block, index):
+    """Like `gen`, as a bit vector.
+    """
+    out = 0
+    for i in block:
+        if 'dest' in i:
+            out |= index[i['dest']]
+    return out
+
+
+def use_bits(block, index):
+    """Like `use`, as a bit vector.
+    """
+    defined = 0
+    used = 0
+    for i in block:
+        for v in i.get('args', []):
+            used |= index[v] & ~defined
+        if 'dest' in i:
+            defined |= index[i['dest']]
+    return used
+
+
+def gen_kill_bits(forward, gen, kill):
+    """Like `gen_kill`, for bit vectors.
+    """
+    return Analysis(
+        forward,
+        init=0,
+        merge=union_bits,
+        transfer=lambda summary, in_: summary[0] | (in_ & ~summary[1]),
+        summarize=lambda block: (gen(block), kill(block)),
+    )
+
+
+def cprop_defs(block):
+    """The values of the variables assigned in a block, as of the end
+    of the block: a constant or '?' for each one.
+    """
+    defs = {}
     for instr in block:
         if 'dest' in instr:
             if instr['op'] == 'const':
-                out_vals[instr['dest']] = instr['value']
+                defs[instr['dest']] = instr['value']
             else:
-                out_vals[instr['dest']] = '?'
+                defs[instr['dest']] = '?'
+    return defs
+
+
+def cprop_transfer(defs, in_vals):
+    out_vals = dict(in_vals)
+    out_vals.update(defs)
     return out_vals
 
 
@@ -139,21 +319,11 @@ def cprop_merge(vals_list):
 ANALYSES = {
     # A really really basic analysis that just accumulates all the
     # currently-defined variables.
-    'defined': Analysis(
-        True,
-        init=set(),
-        merge=union,
-        transfer=lambda block, in_: in_.union(gen(block)),
-    ),
+    'defined': gen_kill(True, gen, lambda block: set()),
 
     # Live variable analysis: the variables that are both defined at a
     # given point and might be read along some path in the future.
-    'live': Analysis(
-        False,
-        init=set(),
-        merge=union,
-        transfer=lambda block, out: use(block).union(out - gen(block)),
-    ),
+    'live': gen_kill(False, use, gen),
 
     # A simple constant propagation pass.
     'cprop': Analysis(
@@ -161,9 +331,30 @@ ANALYSES = {
         init={},
         merge=cprop_merge,
         transfer=cprop_transfer,
+        summarize=cprop_defs,
+    ),
+}
+
+# Versions of the analyses over bit vectors. Each of these takes the
+# variable numbering for a function (from `var_index`) and produces the
+# analysis for that function.
+BIT_ANALYSES = {
+    'defined': lambda index: gen_kill_bits(
+        True,
+        lambda block: gen_bits(block, index),
+        lambda block: 0,
+    ),
+
+    'live': lambda index: gen_kill_bits(
+        False,
+        lambda block: use_bits(block, index),
+        lambda block: gen_bits(block, index),
     ),
 }
 
 if __name__ == '__main__':
-    bril = json.load(sys.stdin)
-    run_df(bril, ANALYSES[sys.argv[1]])
+    bril = load_bril(lazy=True)
+    if '-b' in sys.argv[2:]:
+        run_df_bits(bril, BIT_ANALYSES[sys.argv[1]])
+    else:
+        run_df(bril, ANALYSES[sys.argv[1]])
@@ -1,8 +1,11 @@
+import functools
 import json
 import sys
 
-from cfg import block_map, successors, add_terminators, add_entry
-from form_blocks import form_blocks
+import cfg
+import instrument
+from function import Function
+from util import load_bril
 
 
 def map_inv(succ):
@@ -18,23 +21,8 @@ def map_inv(succ):
     return out
 
 
-def postorder_helper(succ, root, explored, out):
-    """Given a successor edge map, produce a list of all the nodes in
-    the graph in postorder by appending to the `out` list.
-    """
-    if root in explored:
-        return
-    explored.add(root)
-
-    for s in succ[root]:
-        postorder_helper(succ, s, explored, out)
-    out.append(root)
-
-
 def postorder(succ, root):
-    out = []
-    postorder_helper(succ, root, set(), out)
-    return out
+    return cfg.postorder(succ, root)
 
 
 def intersect(sets):
@@ -47,7 +35,190 @@ def intersect(sets):
     return out
 
 
+@instrument.traced()
+def get_idoms(succ, entry):
+    """Find the immediate dominator of every block reachable from the
+    entry, using the iterative algorithm from Cooper, Harvey, and
+    Kennedy's "A Simple, Fast Dominance Algorithm."
+
+    Return a dict mapping each block to its immediate dominator (and the
+    entry to None).
+    """
+    # Number the blocks in postorder, so every block's dominators have
+    # higher numbers than it does, and work on lists of numbers.
+    order = postorder(succ, entry)
+    num = {node: i for i, node in enumerate(order)}
+    preds = [[] for _ in order]
+    for node in order:
+        for s in succ[node]:
+            preds[num[s]].append(num[node])
+
+    root = len(order) - 1
+    idom = [None] * len(order)
+    idom[root] = root
+
+    iterations = 0
+    changed = True
+    while changed:
+        changed = False
+        iterations += 1
+        for i in range(root - 1, -1, -1):  # Reverse postorder.
+            new_idom = None
+            for p in preds[i]:
+                if idom[p] is None:
+                    continue  # Not processed yet.
+                if new_idom is None:
+                    new_idom = p
+                    continue
+
+                # Find the nearest common dominator by walking up from
+                # both blocks until they meet.
+                a, b = p, new_idom
+                while a != b:
+                    while a < b:
+                        a = idom[a]
+                    while b < a:
+                        b = idom[b]
+                new_idom = a
+
+            if idom[i] != new_idom:
+                idom[i] = new_idom
+                changed = True
+    instrument.count('iterations', iterations)
+
+    out = {order[i]: order[d] for i, d in enumerate(idom)}
+    out[entry] = None
+    return out
+
+
+class Dominators:
+    """The dominance information for a CFG, given as a successor map and
+    an entry block.
+
+    This computes only the immediate dominators up front (see
+    `get_idoms`), which takes linear space. The full dominator sets, the
+    dominator tree, and the dominance frontiers are derived from them
+    when they are first used.
+    """
+    def __init__(self, succ, entry):
+        self.succ = succ
+        self.entry = entry
+        self.idom = get_idoms(succ, entry)
+
+    @functools.cached_property
+    def dom(self):
+        """Map every block to the set of blocks that dominate it, like
+        `get_dom`.
+        """
+        # Blocks that are not reachable are left "dominated" by every
+        # block, as in the iterative algorithm, where they are never
+        # updated.
+        out = {v: set(self.idom) for v in self.succ}
+
+        # `idom` is in postorder, so reversing it visits every block
+        # after its immediate dominator.
+        for node in reversed(list(self.idom)):
+            parent = self.idom[node]
+            out[node] = set(out[parent]) if parent is not None else set()
+            out[node].add(node)
+        return out
+
+    @functools.cached_property
+    def tree(self):
+        """The dominator tree, like `dom_tree`: map every block to the
+        set of blocks it immediately dominates.
+        """
+        out = {v: set() for v in self.succ}
+        for node, parent in self.idom.items():
+            if parent is not None:
+                out[parent].add(node)
+
+        # In terms of the full dominator sets, blocks that are not
+        # reachable are dominated by every reachable block, so they end
+        # up as children of all the leaves.
+        unreachable = [v for v in self.succ if v not in self.idom]
+        if unreachable:
+            for leaf in [v for v in self.idom if not out[v]]:
+                out[leaf].update(unreachable)
+
+        return out
+
+    @functools.cached_property
+    def fronts(self):
+        """The dominance frontiers, like `dom_fronts`.
+
+        Rather than looking at all the blocks each block dominates, this
+        walks up the dominator tree from the predecessors of every block:
+        each block on the way, up to (but not including) the block's
+        immediate dominator, has the block in its frontier.
+        """
+        idom = self.idom
+        out = {v: set() for v in self.succ}
+        extra = set()
+        for pred, succs in self.succ.items():
+            if pred not in idom:
+                # Reachable successors of unreachable blocks are treated
+                # specially below.
+                extra.update(s for s in succs if s in idom)
+                continue
+            for node in succs:
+                runner = pred
+                while runner != idom[node]:
+                    if node in out[runner]:
+                        # We already walked up from here to the top.
+                        break
+                    out[runner].add(node)
+                    runner = idom[runner]
+
+        # Unreachable blocks count as dominated by every reachable block,
+        # so their successors are in the frontier of every block that
+        # does not strictly dominate them.
+        if extra:
+            dominates = self._dominates()
+            for block in idom:
+                out[block].update(e for e in extra
+                                  if e == block or not dominates(block, e))
+
+        return {v: list(f) for v, f in out.items()}
+
+    def _dominates(self):
+        """Get a function that checks whether one reachable block
+        dominates another in constant time, using the entry and exit
+        times of a depth-first traversal of the dominator tree.
+        """
+        children = {v: [] for v in self.idom}
+        for node, parent in self.idom.items():
+            if parent is not None:
+                children[parent].append(node)
+
+        enter = {}
+        leave = {}
+        clock = 0
+        stack = [(self.entry, False)]
+        while stack:
+            node, done = stack.pop()
+            clock += 1
+            if done:
+                leave[node] = clock
+            else:
+                enter[node] = clock
+                stack.append((node, True))
+                stack.extend((c, False) for c in children[node])
+
+        return lambda a, b: enter[a] <= enter[b] and leave[b] <= leave[a]
+
+
+@instrument.traced()
 def get_dom(succ, entry):
+    """Map every block to the set of blocks that dominate it."""
+    return Dominators(succ, entry).dom
+
+
+def get_dom_iterative(succ, entry):
+    """Like `get_dom`, but using the simple iterative algorithm, which
+    repeatedly intersects the full dominator sets until they stop
+    changing.
+    """
     pred = map_inv(succ)
     nodes = list(reversed(postorder(succ, entry)))  # Reverse postorder.
 
@@ -106,18 +277,15 @@ def dom_tree(dom):
 
 def print_dom(bril, mode):
     for func in bril['functions']:
-        blocks = block_map(form_blocks(func['instrs']))
-        add_entry(blocks)
-        add_terminators(blocks)
-        succ = {name: successors(block[-1]) for name, block in blocks.items()}
-        dom = get_dom(succ, list(blocks.keys())[0])
+        graph = Function.of(func).cfg(entry=True)
+        dom = Dominators(graph.succs, next(iter(graph.blocks)))
 
         if mode == 'front':
-            res = dom_fronts(dom, succ)
+            res = dom.fronts
         elif mode == 'tree':
-            res = dom_tree(dom)
+            res = dom.tree
         else:
-            res = dom
+            res = dom.dom
 
         # Format as JSON for stable output.
         print(json.dumps(
@@ -128,6 +296,6 @@ def print_dom(bril, mode):
 
 if __name__ == '__main__':
     print_dom(
-        json.load(sys.stdin),
+        load_bril(lazy=True),
         'dom' if len(sys.argv) < 2 else sys.argv[1]
     )
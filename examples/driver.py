@@ -0,0 +1,169 @@
+"""Run a pipeline of passes over a Bril program in a single process.
+
+Instead of a shell pipeline like `python tdce.py | python lvn.py`, which
+starts Python and serializes JSON between every pair of stages, list
+the passes to run in order:
+
+    $ bril2json < prog.bril | python driver.py -p tdce,lvn,ssa -t
+
+All the passes share one in-memory program, and each function's basic
+blocks and CFG are cached across passes (see `function.Function`). With
+`-t`, the wall-clock time for each pass goes to standard error. With
+`--trace FILE`, the detailed per-call events from `instrument` are
+saved too.
+Dataflow analyses print their results to standard error, so standard
+output holds only the final program.
+
+With `--shell`, print the equivalent shell pipeline instead. The tests
+in `test/driver` check that both produce the same program.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+
+import df
+import from_ssa
+import instrument
+import lvn
+import sccp
+import tdce
+import to_ssa
+from function import Function
+from util import load_bril
+
+
+def per_function(func_pass):
+    """Make a whole-program pass out of a pass on single functions."""
+    def run(bril):
+        for func in bril['functions']:
+            func_pass(func)
+    return run
+
+
+def analysis_pass(analysis, run_df=df.run_df):
+    """Make a pass that runs a dataflow analysis and prints the results
+    to standard error.
+    """
+    def run(bril):
+        with contextlib.redirect_stdout(sys.stderr):
+            run_df(bril, analysis)
+    return run
+
+
+# All the passes, by name. Each takes a program and modifies it in place.
+PASSES = {name: per_function(f) for name, f in tdce.MODES.items()}
+PASSES.update({
+    'lvn': lambda bril: lvn.lvn(bril),
+    'lvn+': lambda bril: lvn.lvn(bril, prop=True, canon=True, fold=True),
+    'gvn': lambda bril: lvn.lvn(bril, prop=True, canon=True, fold=True,
+                                gvn=True),
+    'ssa': to_ssa.to_ssa,
+    'ssa-semi-pruned': lambda bril: to_ssa.to_ssa(bril, 'semi'),
+    'ssa-pruned': lambda bril: to_ssa.to_ssa(bril, 'full'),
+    'from_ssa': from_ssa.from_ssa,
+    'from_ssa-parallel': lambda bril: from_ssa.from_ssa(bril, True),
+    'from_ssa-coalesce': lambda bril: from_ssa.from_ssa(bril, True, True),
+    'sccp': sccp.sccp,
+})
+PASSES.update({name: analysis_pass(a) for name, a in df.ANALYSES.items()})
+PASSES.update({name + '-bits': analysis_pass(a, df.run_df_bits)
+               for name, a in df.BIT_ANALYSES.items()})
+
+# The command that runs each program-changing pass as its own script, for
+# building the equivalent shell pipeline. Analyses don't change the
+# program, so they have none.
+SHELL_COMMANDS = {name: 'tdce.py ' + name for name in tdce.MODES}
+SHELL_COMMANDS.update({
+    'lvn': 'lvn.py',
+    'lvn+': 'lvn.py -p -c -f',
+    'gvn': 'lvn.py -g -p -c -f',
+    'ssa': 'to_ssa.py',
+    'ssa-semi-pruned': 'to_ssa.py --semi-pruned',
+    'ssa-pruned': 'to_ssa.py --pruned',
+    'from_ssa': 'from_ssa.py',
+    'from_ssa-parallel': 'from_ssa.py --parallel',
+    'from_ssa-coalesce': 'from_ssa.py --coalesce',
+    'sccp': 'sccp.py',
+})
+
+
+def run_pipeline(bril, names):
+    """Run the named passes, in order, on a program. Return a list of
+    `(name, seconds)` pairs with the time each pass took.
+    """
+    # Work on cached function wrappers. They keep the underlying
+    # function dicts in `bril` up to date as the passes change them.
+    prog = dict(bril)
+    prog['functions'] = [Function(f) for f in bril['functions']]
+
+    times = []
+    for name in names:
+        start = time.perf_counter()
+        PASSES[name](prog)
+        times.append((name, time.perf_counter() - start))
+    return times
+
+
+def shell_pipeline(names):
+    """Get a shell pipeline that runs the named passes as separate
+    scripts and should produce the same program as `run_pipeline`.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    stages = ['python3 {}'.format(os.path.join(here, SHELL_COMMANDS[n]))
+              for n in names if n in SHELL_COMMANDS]
+    return ' | '.join(stages) or 'cat'
+
+
+def driver():
+    parser = argparse.ArgumentParser(
+        description='Optimize a Bril program with a pipeline of passes.',
+    )
+    parser.add_argument('-p', '--passes', default='',
+                        help='comma-separated passes to run, in order '
+                             '(choose from: {})'.format(', '.join(PASSES)))
+    parser.add_argument('-t', '--time', action='store_true',
+                        help='report the time each pass takes')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='save instrumentation events (a Chrome trace, '
+                             'or JSON lines if FILE ends in .jsonl)')
+    parser.add_argument('--shell', action='store_true',
+                        help='print the equivalent shell pipeline instead '
+                             'of running the passes')
+    args = parser.parse_args()
+
+    names = [n for n in args.passes.split(',') if n]
+    for name in names:
+        if name not in PASSES:
+            parser.error('unknown pass {}'.format(name))
+
+    if args.shell:
+        print(shell_pipeline(names))
+        return
+
+    bril = load_bril()
+    if args.trace:
+        instrument.enable()
+    try:
+        times = run_pipeline(bril, names)
+    except ValueError as exc:
+        # Passes raise this for input they can't handle, like a
+        # function that isn't in SSA form.
+        sys.exit('driver: {}'.format(exc))
+    if args.trace:
+        instrument.disable()
+        instrument.write(args.trace)
+    json.dump(bril, sys.stdout, indent=2, sort_keys=True)
+
+    if args.time:
+        for name, secs in times:
+            print('{}: {:.3f} ms'.format(name, secs * 1000), file=sys.stderr)
+        print('total: {:.3f} ms'.format(sum(s for _, s in times) * 1000),
+              file=sys.stderr)
+
+
+if __name__ == '__main__':
+    driver()
@@ -1,11 +1,11 @@
 """Create and print out the basic blocks in a Bril function.
 """
 
-import json
-import sys
+from opcodes import TERMINATOR_OPS
+from util import load_bril
 
 # Instructions that terminate a basic block.
-TERMINATORS = 'br', 'jmp', 'ret'
+TERMINATORS = TERMINATOR_OPS
 
 
 def form_blocks(instrs):
@@ -68,4 +68,4 @@ def print_blocks(bril):
 
 
 if __name__ == '__main__':
-    print_blocks(json.load(sys.stdin))
+    print_blocks(load_bril(lazy=True))
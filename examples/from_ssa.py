@@ -1,14 +1,42 @@
+"""Convert Bril functions out of SSA form by replacing phi-nodes with
+copies:
+
+    $ bril2json < prog.bril | python from_ssa.py [--parallel]
+
+The default, naive translation puts a copy for every phi-node argument
+at the end of the corresponding predecessor block. That is wrong when
+the predecessor has other successors where the phi-node's destination
+is still live (the "lost copy" problem), or when phi-nodes in the same
+block read each other's destinations (the "swap" problem).
+
+With `--parallel`, the translation first splits critical edges (from
+blocks with several successors to blocks with several predecessors), so
+every edge that needs copies gets a place of its own to put them. All
+the phi-nodes at the start of a block happen at once, so the copies for
+each edge form a parallel copy, which is then sequentialized, using a
+temporary only to break cycles. This takes linear time in the size of
+the function.
+
+With `--coalesce` (which implies `--parallel`), a phi-node's destination
+and arguments are first merged into a single variable wherever their
+live ranges don't interfere, so the copies between them disappear.
+"""
+
 import json
 import sys
+from collections import OrderedDict, defaultdict, deque
 
-from cfg import block_map, add_terminators, add_entry, reassemble
-from form_blocks import form_blocks
+from cfg import reassemble
+from df import ANALYSES, df_worklist
+import instrument
+from function import Function
+from util import fresh, load_bril
 
 
+@instrument.traced(size=instrument.func_size)
 def func_from_ssa(func):
-    blocks = block_map(form_blocks(func['instrs']))
-    add_entry(blocks)
-    add_terminators(blocks)
+    fn = Function.of(func)
+    blocks = fn.cfg(entry=True).blocks
 
     # Replace each phi-node.
     for block in blocks.values():
@@ -34,14 +62,274 @@ def func_from_ssa(func):
         new_block = [i for i in block if i.get('op') != 'phi']
         block[:] = new_block
 
-    func['instrs'] = reassemble(blocks)
+    fn.set_instrs(reassemble(blocks))
+
+
+def _copy(dest, src, type):
+    return {'op': 'id', 'type': type, 'args': [src], 'dest': dest}
+
+
+def sequentialize(copies, temp):
+    """Turn a parallel copy into a list of `id` instructions that has the
+    same effect when run in order.
+
+    `copies` is a list of `(dest, src, type)` triples, all with
+    different destinations. `temp()` makes a fresh variable, which
+    is needed once for every cycle of copies (like a swap).
+    """
+    # The copies that are still to do, by destination.
+    pending = {dest: (src, type) for dest, src, type in copies
+               if src != dest}
+
+    # Count the pending copies that read each variable. A copy is ready
+    # once nothing else needs the old value of its destination.
+    readers = defaultdict(int)
+    for src, _ in pending.values():
+        readers[src] += 1
+    if readers.keys().isdisjoint(pending):
+        # Usually, no copy reads another's destination, so any order is
+        # fine.
+        return [_copy(dest, src, type) for dest, (src, type)
+                in pending.items()]
+    ready = deque(dest for dest in pending if not readers[dest])
+
+    out = []
+    while ready:
+        dest = ready.popleft()
+        src, type = pending.pop(dest)
+        out.append(_copy(dest, src, type))
+        readers[src] -= 1
+        if not readers[src] and src in pending:
+            ready.append(src)
+
+    # Every variable left is written once and read once, so the rest of
+    # the copies form disjoint cycles. Save one value in each cycle to a
+    # temporary and rotate the others.
+    while pending:
+        start = next(iter(pending))
+        saved = temp()
+        out.append(_copy(saved, start, pending[start][1]))
+        dest = start
+        while True:
+            src, type = pending.pop(dest)
+            if src == start:
+                out.append(_copy(dest, saved, type))
+                break
+            out.append(_copy(dest, src, type))
+            dest = src
+
+    return out
+
+
+def ssa_liveness(graph, params):
+    """Find where every variable in an SSA-form CFG is defined and how
+    far it lives.
+
+    Return three maps: from variables to their `(block, index)`
+    definition sites, from blocks to the variables live at their ends,
+    and from blocks to the index of the last use of each variable in
+    them. Indices count the block's instructions other than phi-nodes.
+    Phi-nodes (and function parameters) define their destinations at
+    index -1, before anything else in the block, and use their arguments
+    at the end of the predecessor blocks, after everything else.
+    """
+    blocks = graph.blocks
+    entry = next(iter(blocks))
+    defs = {p: (entry, -1) for p in params}
+    phi_defs = defaultdict(list)
+    phi_uses = defaultdict(list)
+    bodies = {}
+    for name, block in blocks.items():
+        bodies[name] = []
+        for instr in block:
+            if instr.get('op') == 'phi':
+                defs[instr['dest']] = (name, -1)
+                phi_defs[name].append({'dest': instr['dest']})
+                for label, arg in zip(instr['labels'], instr['args']):
+                    phi_uses[label].append(arg)
+            else:
+                if 'dest' in instr:
+                    defs[instr['dest']] = (name, len(bodies[name]))
+                bodies[name].append(instr)
+
+    last_use = {}
+    for name, body in bodies.items():
+        last_use[name] = uses = {}
+        for i, instr in enumerate(body):
+            for arg in instr.get('args', []):
+                uses[arg] = i
+        for arg in phi_uses[name]:
+            uses[arg] = len(body)
+
+    # For the `live` analysis, the phi-nodes become plain definitions at
+    # the start of their blocks and uses at the end of their
+    # predecessors.
+    live_blocks = {
+        name: phi_defs[name] + body + [{'args': phi_uses[name]}]
+        for name, body in bodies.items()
+    }
+    _, live_out = df_worklist(live_blocks, ANALYSES['live'],
+                              (graph.preds, graph.succs))
+    for name, args in phi_uses.items():
+        live_out[name] = live_out[name] | set(args)
+
+    return defs, live_out, last_use
+
+
+def coalesce(graph, params):
+    """Merge each phi-node's destination with its arguments where their
+    live ranges don't interfere. Return a map from variables to the
+    names of the merged variables they belong to.
+
+    Two variables interfere if either one is live where the other is
+    defined, or if they are defined at the same place (like two
+    phi-nodes in the same block, which are written by the same parallel
+    copies).
+    """
+    defs, live_out, last_use = ssa_liveness(graph, params)
+
+    def live_at(var, site):
+        block, index = site
+        def_block, def_index = defs[var]
+        if def_block == block and def_index > index:
+            return False  # Not defined yet.
+        return var in live_out[block] or \
+            last_use[block].get(var, -2) > index
+
+    def interfere(a, b):
+        return defs[a] == defs[b] or live_at(a, defs[b]) or \
+            live_at(b, defs[a])
+
+    # A union-find forest of variables. The root of each set is the name
+    # for the merged variable: the destination of the first phi-node
+    # that merged it, or a function parameter (which can't be renamed).
+    parent = {}
+    members = {}
+
+    def find(var):
+        root = var
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while var != root:  # Compress the path.
+            parent[var], var = root, parent[var]
+        return root
+
+    for block in graph.blocks.values():
+        for instr in block:
+            if instr.get('op') != 'phi':
+                continue
+            for arg in instr['args']:
+                a, b = find(instr['dest']), find(arg)
+                if a == b or arg not in defs:
+                    continue
+                a_members = members.get(a, [a])
+                b_members = members.get(b, [b])
+                if any(interfere(x, y)
+                       for x in a_members for y in b_members):
+                    continue
+                if b in params:
+                    a, b = b, a
+                parent[b] = a
+                members[a] = a_members + b_members
+                members.pop(b, None)
+
+    return {var: root for root, vs in members.items() for var in vs}
+
+
+def _rename(instr, names):
+    instr = dict(instr)
+    if 'dest' in instr:
+        instr['dest'] = names.get(instr['dest'], instr['dest'])
+    if 'args' in instr:
+        instr['args'] = [names.get(a, a) for a in instr['args']]
+    return instr
+
+
+@instrument.traced(size=instrument.func_size)
+def func_from_ssa_parallel(func, coalescing=False):
+    fn = Function.of(func)
+    graph = fn.cfg(entry=True)
+    blocks = graph.blocks
+
+    if coalescing:
+        params = {a['name'] for a in fn.func.get('args', [])}
+        merged = coalesce(graph, params)
+        if merged:
+            blocks = {name: [_rename(i, merged) for i in block]
+                      for name, block in blocks.items()}
+
+    # Gather the parallel copy for every edge into a block with
+    # phi-nodes. An undefined argument needs no copy.
+    copies = defaultdict(list)
+    for name, block in blocks.items():
+        for instr in block:
+            if instr.get('op') == 'phi':
+                for label, arg in zip(instr['labels'], instr['args']):
+                    if arg != '__undefined':
+                        copies[label, name].append(
+                            (instr['dest'], arg, instr['type'])
+                        )
+
+    # Find all the variable names only if we need a temporary.
+    variables = set()
+
+    def temp():
+        if not variables:
+            variables.update(a['name'] for a in fn.func.get('args', []))
+            variables.update(i['dest'] for block in blocks.values()
+                             for i in block if 'dest' in i)
+        var = fresh('swap', variables)
+        variables.add(var)
+        return var
+
+    names = set(blocks)
+
+    # Where each edge's copies go: at the start of the successor, at the
+    # end of the predecessor, or in a new block on a critical edge.
+    at_start = defaultdict(list)
+    at_end = defaultdict(list)
+    split = defaultdict(list)
+    for (pred, succ), edge_copies in copies.items():
+        instrs = sequentialize(edge_copies, temp)
+        if len(graph.preds[succ]) == 1:
+            at_start[succ] += instrs
+        elif len(set(graph.succs[pred])) == 1:
+            at_end[pred] += instrs
+        else:
+            label = fresh('{}.{}.'.format(pred, succ), names)
+            names.add(label)
+            split[pred].append((succ, label, instrs))
+
+    # Build the new blocks, with each new block right after the block
+    # whose edge it splits.
+    new_blocks = OrderedDict()
+    for name, block in blocks.items():
+        body = at_start[name] + [i for i in block if i.get('op') != 'phi']
+        term = body.pop()
+        body += at_end[name]
+
+        if split[name]:
+            targets = {succ: label for succ, label, _ in split[name]}
+            term = dict(term, labels=[targets.get(t, t)
+                                      for t in term['labels']])
+        new_blocks[name] = body + [term]
+
+        for succ, label, instrs in split[name]:
+            new_blocks[label] = instrs + [{'op': 'jmp', 'labels': [succ]}]
+
+    fn.set_instrs(reassemble(new_blocks))
 
 
-def from_ssa(bril):
+def from_ssa(bril, parallel=False, coalescing=False):
     for func in bril['functions']:
-        func_from_ssa(func)
+        if parallel or coalescing:
+            func_from_ssa_parallel(func, coalescing)
+        else:
+            func_from_ssa(func)
     return bril
 
 
 if __name__ == '__main__':
-    print(json.dumps(from_ssa(json.load(sys.stdin)), indent=2, sort_keys=True))
+    print(json.dumps(from_ssa(load_bril(), '--parallel' in sys.argv[1:],
+                              '--coalesce' in sys.argv[1:]),
+                     indent=2, sort_keys=True))
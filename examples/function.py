@@ -0,0 +1,109 @@
+"""Cached analyses for Bril functions.
+
+A `Function` wraps a function from a Bril program and builds its basic
+blocks and control-flow graph only when they are first needed. Passes
+that edit the blocks in place report what they changed, and only the
+analyses that the change could affect are thrown away. This way, a
+sequence of passes (or a pass that iterates to a fixed point) does not
+rebuild the same structures over and over.
+
+Passes here accept either a plain function dict or a `Function` (see
+`Function.of`); with a plain dict, they just don't benefit from caching
+between calls.
+"""
+
+from collections import namedtuple
+
+import cfg
+from form_blocks import form_blocks
+from util import flatten
+
+# A control-flow graph: an ordered map from block names to blocks (each
+# ending in a terminator) and maps from block names to the lists of
+# names of their predecessors and successors.
+CFG = namedtuple('CFG', ['blocks', 'preds', 'succs'])
+
+
+class Function:
+    def __init__(self, func):
+        self.func = func
+        self._blocks = None
+        self._cfgs = {}
+        self._edges = {}
+
+    @classmethod
+    def of(cls, func):
+        """Wrap a function dict, or return a `Function` unchanged."""
+        if isinstance(func, cls):
+            return func
+        return cls(func)
+
+    @property
+    def name(self):
+        return self.func['name']
+
+    @property
+    def blocks(self):
+        """The list of basic blocks (from `form_blocks`), which include
+        their labels. Passes may edit these blocks in place and then
+        call `changed`.
+        """
+        if self._blocks is None:
+            self._blocks = list(form_blocks(self.func['instrs']))
+        return self._blocks
+
+    def cfg(self, entry=False):
+        """Get the control-flow graph for the function.
+
+        Every block in the graph has a terminator (see
+        `cfg.add_terminators`). With `entry`, the graph also has a unique
+        entry block with no predecessors (see `cfg.add_entry`). The
+        graph's blocks are copies of `blocks` without the labels and
+        with the added terminators, but they share the instructions.
+        Adding or removing instructions in the graph's blocks does not
+        change `blocks`.
+        """
+        if entry not in self._cfgs:
+            # Copy every block, including the ones without labels, so
+            # the added terminators stay out of `blocks`.
+            blocks = cfg.block_map([list(b) for b in self.blocks])
+            if entry:
+                cfg.add_entry(blocks)
+            cfg.add_terminators(blocks)
+
+            # The edges survive changes that don't affect control flow.
+            if entry not in self._edges:
+                self._edges[entry] = cfg.edges(blocks)
+            preds, succs = self._edges[entry]
+
+            self._cfgs[entry] = CFG(blocks, preds, succs)
+        return self._cfgs[entry]
+
+    def changed(self, control_flow=False):
+        """Record that a pass edited the instructions in `blocks` in
+        place, and update the function's instruction list to match.
+
+        Pass `control_flow=True` if the pass changed control flow (e.g.,
+        it edited labels or terminators) so that everything is rebuilt.
+        Otherwise, the control-flow edges are kept.
+        """
+        if self._blocks is not None:
+            if not all(self._blocks):
+                # Dropping an empty block renames the anonymous blocks
+                # after it, so the edges are no longer valid.
+                self._blocks = [b for b in self._blocks if b]
+                control_flow = True
+            self.func['instrs'] = flatten(self._blocks)
+        self._cfgs.clear()
+        if control_flow:
+            self._blocks = None
+            self._edges.clear()
+
+    def set_instrs(self, instrs):
+        """Replace the function's instructions, which discards all the
+        cached analyses.
+        """
+        self.func['instrs'] = instrs
+        self._blocks = None
+        self._cfgs.clear()
+        self._edges.clear()
@@ -0,0 +1,146 @@
+"""A compact in-memory representation for Bril instructions.
+
+Parsed from JSON, every instruction is a dict. An `Instr` stores the
+standard fields in `__slots__` instead, which takes much less memory. It
+supports the parts of the dict interface that the passes here use
+(`instr['op']`, `instr.get('args', [])`, `'dest' in instr`, `update`,
+`del instr['args']`, and so on), so `form_blocks`, `cfg`, `lvn`, and
+`tdce` work the same on either representation. Any other fields (like
+`pos`) are kept too, so conversion back to dicts is lossless.
+
+`to_instrs` also interns the names in each instruction, so every use of
+a variable, opcode, or label shares a single string object.
+"""
+
+import sys
+
+# The fields that get their own slots.
+FIELDS = ('op', 'dest', 'type', 'args', 'funcs', 'labels', 'value', 'label')
+
+# The fields holding names (or lists of names) to intern.
+NAME_FIELDS = ('op', 'dest', 'type', 'label')
+NAME_LIST_FIELDS = ('args', 'funcs', 'labels')
+
+_FIELD_SET = frozenset(FIELDS)
+
+
+class Instr:
+    """A Bril instruction (or label) that acts like its JSON dict.
+
+    Absent standard fields are unset attributes. Only the instruction's
+    fields are keys: the class's own attributes (like `get` or `keys`)
+    are not, and a missing key raises `KeyError`, just as for a dict.
+    """
+    # `_extra` holds nonstandard fields in a dict. It stays `None` until
+    # one is actually set.
+    __slots__ = FIELDS + ('_extra',)
+
+    def __init__(self, fields=()):
+        self._extra = None
+        self.update(fields)
+
+    def __getitem__(self, key):
+        if key in _FIELD_SET:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra is None:
+            raise KeyError(key)
+        return self._extra[key]
+
+    def __setitem__(self, key, value):
+        if key in _FIELD_SET:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key in _FIELD_SET:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        elif self._extra is None:
+            raise KeyError(key)
+        else:
+            del self._extra[key]
+
+    def __contains__(self, key):
+        if key in _FIELD_SET:
+            return hasattr(self, key)
+        return self._extra is not None and key in self._extra
+
+    def get(self, key, default=None):
+        if key in _FIELD_SET:
+            return getattr(self, key, default)
+        if self._extra is None:
+            return default
+        return self._extra.get(key, default)
+
+    def update(self, fields):
+        for key, value in dict(fields).items():
+            self[key] = value
+
+    def keys(self):
+        out = [f for f in FIELDS if hasattr(self, f)]
+        if self._extra is not None:
+            out += self._extra
+        return out
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, other):
+        return to_dict(self) == to_dict(other)
+
+    def __repr__(self):
+        return 'Instr({!r})'.format(to_dict(self))
+
+    def to_dict(self):
+        return {key: self[key] for key in self.keys()}
+
+
+def to_dict(instr):
+    """Get the JSON dict for an `Instr` (or a dict, which is returned
+    unchanged).
+    """
+    if isinstance(instr, Instr):
+        return instr.to_dict()
+    return instr
+
+
+def from_dict(instr):
+    """Make an `Instr` from a JSON dict, interning its names."""
+    out = Instr(instr)
+    for key in NAME_FIELDS:
+        value = out.get(key)
+        if isinstance(value, str):
+            out[key] = sys.intern(value)
+    for key in NAME_LIST_FIELDS:
+        if key in out:
+            out[key] = [sys.intern(n) for n in out[key]]
+    return out
+
+
+def to_instrs(bril):
+    """Convert every instruction in a program to an `Instr`, in place.
+    Return the program.
+    """
+    for func in bril['functions']:
+        func['instrs'] = [from_dict(i) for i in func['instrs']]
+    return bril
+
+
+def to_dicts(bril):
+    """Convert every instruction in a program back to a dict, in place.
+    Return the program.
+    """
+    for func in bril['functions']:
+        func['instrs'] = [to_dict(i) for i in func['instrs']]
+    return bril
@@ -0,0 +1,171 @@
+"""Opt-in instrumentation for the optimization passes.
+
+Entry points decorated with `traced` record an event every time they
+run: the wall-clock time, the peak memory they allocated (according to
+`tracemalloc`), the number of instructions before and after, and any
+counters the pass reports with `count` (like the number of iterations
+it took to reach a fixed point).
+
+Instrumentation is off by default, and then a traced function only
+costs one extra call and a flag check. Turn it on with `enable`, or set
+the `BRIL_TRACE` environment variable to a file name to trace any of
+the example scripts:
+
+    $ bril2json < prog.bril | BRIL_TRACE=trace.json python to_ssa.py
+
+If the file name ends in `.jsonl`, the events are appended as JSON
+lines, so the stages of a shell pipeline can share one file. Otherwise,
+the file is a Chrome trace (open it in `chrome://tracing` or Perfetto).
+"""
+
+import atexit
+import functools
+import json
+import os
+import time
+import tracemalloc
+
+_enabled = False
+_memory = False
+_epoch = 0.0
+
+# The recorded events, in the order the calls finished.
+events = []
+
+# A frame for every traced call in progress, innermost last.
+_stack = []
+
+
+def enable(memory=True):
+    """Start recording events. With `memory`, also track peak memory
+    use (which slows everything down).
+    """
+    global _enabled, _memory, _epoch
+    _enabled = True
+    _memory = memory
+    _epoch = time.perf_counter()
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable():
+    """Stop recording events."""
+    global _enabled
+    _enabled = False
+    if _memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def func_size(func):
+    """Count the instructions in a function dict or `Function`."""
+    return len(getattr(func, 'func', func)['instrs'])
+
+
+def blocks_size(blocks):
+    """Count the instructions in a map from names to blocks."""
+    return sum(len(block) for block in blocks.values())
+
+
+def traced(name=None, size=None):
+    """Decorate a pass entry point to record its calls.
+
+    `size` is a function that counts the instructions in the first
+    argument to the call; it is used before and after the call. Omit it
+    for functions that don't work on instructions.
+    """
+    def decorator(func):
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            return _call(label, size, func, args, kwargs)
+        return wrapper
+    return decorator
+
+
+def count(key, n=1):
+    """Add `n` to a counter on the innermost traced call in progress.
+    Does nothing when instrumentation is off.
+    """
+    if _stack:
+        counters = _stack[-1]['counters']
+        counters[key] = counters.get(key, 0) + n
+
+
+def _call(name, size, func, args, kwargs):
+    event = {'name': name}
+    if size:
+        event['instrs_in'] = size(args[0])
+
+    frame = {'counters': {}}
+    if _memory:
+        # `tracemalloc` has a single peak, so save the peak so far for
+        # the enclosing call before resetting it for this one.
+        current, peak = tracemalloc.get_traced_memory()
+        if _stack:
+            _stack[-1]['peak'] = max(_stack[-1]['peak'], peak)
+        tracemalloc.reset_peak()
+        frame['base'] = frame['peak'] = current
+    _stack.append(frame)
+
+    start = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        end = time.perf_counter()
+        _stack.pop()
+
+        event['start'] = start - _epoch
+        event['time'] = end - start
+        if _memory:
+            peak = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+            event['peak_mem'] = peak - frame['base']
+            if _stack:
+                _stack[-1]['peak'] = max(_stack[-1]['peak'], peak)
+        if size:
+            event['instrs_out'] = size(args[0])
+        event.update(frame['counters'])
+        events.append(event)
+
+
+def dump_jsonl(fp):
+    """Write the events as JSON lines."""
+    for event in events:
+        fp.write(json.dumps(event, sort_keys=True) + '\n')
+
+
+def dump_chrome_trace(fp):
+    """Write the events in the Chrome trace event format."""
+    pid = os.getpid()
+    trace = []
+    for event in events:
+        trace.append({
+            'name': event['name'],
+            'ph': 'X',  # A complete event, with a duration.
+            'ts': event['start'] * 1e6,
+            'dur': event['time'] * 1e6,
+            'pid': pid,
+            'tid': 0,
+            'args': {k: v for k, v in event.items()
+                     if k not in ('name', 'start', 'time')},
+        })
+    json.dump({'traceEvents': trace}, fp, indent=2)
+
+
+def write(path):
+    """Save the events to a file, picking the format from its name (see
+    the module documentation).
+    """
+    if path.endswith('.jsonl'):
+        with open(path, 'a') as f:
+            dump_jsonl(f)
+    else:
+        with open(path, 'w') as f:
+            dump_chrome_trace(f)
+
+
+if os.environ.get('BRIL_TRACE'):
+    enable()
+    atexit.register(write, os.environ['BRIL_TRACE'])
@@ -1,5 +1,17 @@
-import json
-import sys
+from util import load_bril
+
+
+def func_is_ssa(func):
+    """Check whether a single function assigns to each variable once.
+    """
+    assigned = set()
+    for instr in func['instrs']:
+        if 'dest' in instr:
+            if instr['dest'] in assigned:
+                return False
+            else:
+                assigned.add(instr['dest'])
+    return True
 
 
 def is_ssa(bril):
@@ -7,16 +19,8 @@ def is_ssa(bril):
 
     Every function in the program may assign to each variable once.
     """
-    for func in bril['functions']:
-        assigned = set()
-        for instr in func['instrs']:
-            if 'dest' in instr:
-                if instr['dest'] in assigned:
-                    return False
-                else:
-                    assigned.add(instr['dest'])
-    return True
+    return all(func_is_ssa(func) for func in bril['functions'])
 
 
 if __name__ == '__main__':
-    print('yes' if is_ssa(json.load(sys.stdin)) else 'no')
+    print('yes' if is_ssa(load_bril(lazy=True)) else 'no')
@@ -1,11 +1,18 @@
 """Local value numbering for Bril.
+
+With `-g`, this does global value numbering instead, on functions in
+SSA form (see `func_gvn`).
 """
 import json
 import sys
 from collections import namedtuple
 
-from form_blocks import form_blocks
-from util import flatten
+import instrument
+from dom import Dominators
+from function import Function
+from is_ssa import func_is_ssa
+from opcodes import COMMUTATIVE_OPS, PURE_OPS
+from util import load_bril
 
 # A Value uniquely represents a computation in terms of sub-values.
 Value = namedtuple('Value', ['op', 'args'])
@@ -42,7 +49,8 @@ def last_writes(instrs):
     """
     out = [False] * len(instrs)
     seen = set()
-    for idx, instr in reversed(list(enumerate(instrs))):
+    for idx in range(len(instrs) - 1, -1, -1):
+        instr = instrs[idx]
         if 'dest' in instr:
             dest = instr['dest']
             if dest not in seen:
@@ -64,6 +72,7 @@ def read_first(instrs):
     return read
 
 
+@instrument.traced(size=len)
 def lvn_block(block, lookup, canonicalize, fold):
     """Use local value numbering to optimize a basic block. Modify the
     instructions in place.
@@ -98,6 +107,12 @@ def lvn_block(block, lookup, canonicalize, fold):
     # to a different variable holding the same value.
     num2vars = {}
 
+    # The inverse of `num2vars`: for every variable in one of its lists,
+    # the number whose list it is in. (A variable is in at most one list
+    # at a time.) This lets us find the entry to remove when a variable
+    # is clobbered without searching all the lists.
+    home = {}
+
     # Track constant values for values assigned with `const`.
     num2const = {}
 
@@ -106,6 +121,7 @@ def lvn_block(block, lookup, canonicalize, fold):
     for var in read_first(block):
         num = var2num.add(var)
         num2vars[num] = [var]
+        home[var] = num
 
     for instr, last_write in zip(block, last_writes(block)):
         # Look up the value numbers for all variable arguments,
@@ -120,10 +136,8 @@ def lvn_block(block, lookup, canonicalize, fold):
         # If we write to a variable, we "clobber" any previous value it
         # may have held. Remove any entries that point to this variable
         # as the "home" for old values.
-        if 'dest' in instr:
-            for rhs in num2vars.values():
-                if instr['dest'] in rhs:
-                    rhs.remove(instr['dest'])
+        if 'dest' in instr and instr['dest'] in home:
+            num2vars[home.pop(instr['dest'])].remove(instr['dest'])
 
         # Non-call value operations are candidates for replacement. (We
         # could conceivably include calls to pure functions as values,
@@ -153,6 +167,7 @@ def lvn_block(block, lookup, canonicalize, fold):
                         'args': [num2vars[num][0]],
                     })
                     num2vars[num].append(instr['dest'])
+                    home[instr['dest']] = num
                 continue
 
         # If this instruction produces a result, give it a number.
@@ -174,6 +189,7 @@ def lvn_block(block, lookup, canonicalize, fold):
 
             # Record the variable name and update the instruction.
             num2vars[newnum] = [var]
+            home[var] = newnum
             instr['dest'] = var
 
             if val is not None:
@@ -252,31 +268,171 @@ def _fold(num2const, value):
 
 
 def _canonicalize(value):
-    """Cannibalize values for commutative math operators.
+    """Cannibalize values for commutative operators.
     """
-    if value.op in ('add', 'mul'):
+    if value.op in COMMUTATIVE_OPS:
         return Value(value.op, tuple(sorted(value.args)))
     else:
         return value
 
 
-def lvn(bril, prop=False, canon=False, fold=False):
+@instrument.traced(size=instrument.func_size)
+def func_gvn(func, lookup, canonicalize, fold):
+    """Use global value numbering to optimize a function in SSA form.
+
+    This works like `lvn_block` (and takes the same extension functions)
+    but walks the whole dominator tree, so a value computed in one block
+    is reused in all the blocks it dominates. The table of available
+    values is scoped: the values a block computes are forgotten again
+    once we are done with the blocks it dominates. Every variable is
+    assigned only once, so nothing else ever needs to be forgotten, and
+    there is no need to rename destinations.
+
+    Raise a `ValueError` if the function is not in SSA form.
+    """
+    fn = Function.of(func)
+    if not func_is_ssa(fn.func):
+        raise ValueError('@{} is not in SSA form (use to_ssa.py)'.format(
+            fn.name))
+
+    # The dominator tree needs an entry block without predecessors. The
+    # instructions are only edited in place (the graph's blocks share
+    # them with `fn.blocks`), so any block or terminators the CFG adds
+    # never make it into the function.
+    graph = fn.cfg()
+    if graph.preds[next(iter(graph.blocks))]:
+        graph = fn.cfg(entry=True)
+    entry = next(iter(graph.blocks))
+    tree = Dominators(graph.succs, entry).tree
+
+    var2num = Numbering()
+    value2num = {}
+    num2var = {}  # The canonical variable for every value number.
+    num2const = {}
+
+    def number(var):
+        # Variables we haven't seen (like function arguments) are their
+        # own canonical source.
+        if var not in var2num:
+            num2var[var2num.add(var)] = var
+        return var2num[var]
+
+    def new_value(instr):
+        num = var2num.add(instr['dest'])
+        num2var[num] = instr['dest']
+        if instr['op'] == 'const':
+            num2const[num] = instr['value']
+        return num
+
+    def number_block(block):
+        """Number the instructions in a block, and return the values
+        that it makes available.
+        """
+        added = []
+        for instr in block:
+            if instr.get('op') == 'phi':
+                # The arguments come from other blocks, which we may not
+                # have seen yet. They are updated at the end.
+                new_value(instr)
+                continue
+
+            if 'args' in instr:
+                argnums = tuple(number(a) for a in instr['args'])
+                instr['args'] = [num2var[n] for n in argnums]
+            if 'dest' not in instr:
+                continue
+            if 'args' not in instr or instr['op'] not in PURE_OPS:
+                new_value(instr)
+                continue
+
+            val = canonicalize(Value(instr['op'], argnums))
+            num = lookup(value2num, val)
+            if num is not None:
+                # The value is available, so replace the instruction
+                # with a copy or a constant.
+                var2num[instr['dest']] = num
+                if num in num2const:
+                    instr.update({
+                        'op': 'const',
+                        'value': num2const[num],
+                    })
+                    del instr['args']
+                else:
+                    instr.update({
+                        'op': 'id',
+                        'args': [num2var[num]],
+                    })
+                continue
+
+            num = new_value(instr)
+            const = fold(num2const, val)
+            if const is not None:
+                num2const[num] = const
+                instr.update({
+                    'op': 'const',
+                    'value': const,
+                })
+                del instr['args']
+                continue
+            value2num[val] = num
+            added.append(val)
+        return added
+
+    # Walk the dominator tree with an explicit stack. When we finish a
+    # block's subtree, remove the values it added. (Unreachable blocks
+    # appear in the tree more than once; only visit them once.)
+    visited = set()
+    work = [(entry, None)]
+    while work:
+        block, added = work.pop()
+        if added is not None:
+            for val in added:
+                del value2num[val]
+            continue
+        if block in visited:
+            continue
+        visited.add(block)
+
+        work.append((block, number_block(graph.blocks[block])))
+        for b in sorted(tree[block], reverse=True):
+            work.append((b, None))
+
+    # Update phi-node arguments to the canonical variables, which are
+    # available wherever the originals are.
+    for block in graph.blocks.values():
+        for instr in block:
+            if instr.get('op') == 'phi':
+                instr['args'] = [num2var[var2num[a]] if a in var2num else a
+                                 for a in instr['args']]
+
+    fn.changed()
+
+
+def lvn(bril, prop=False, canon=False, fold=False, gvn=False):
     """Apply the local value numbering optimization to every basic block
-    in every function.
+    in every function. With `gvn`, use global value numbering instead
+    (which raises a `ValueError` for functions not in SSA form).
     """
+    lookup = _lookup if prop else lambda v2n, v: v2n.get(v)
+    canonicalize = _canonicalize if canon else lambda v: v
+    fold = _fold if fold else lambda n2c, v: None
+
     for func in bril['functions']:
-        blocks = list(form_blocks(func['instrs']))
-        for block in blocks:
-            lvn_block(
-                block,
-                lookup=_lookup if prop else lambda v2n, v: v2n.get(v),
-                canonicalize=_canonicalize if canon else lambda v: v,
-                fold=_fold if fold else lambda n2c, v: None,
-            )
-        func['instrs'] = flatten(blocks)
+        if gvn:
+            func_gvn(func, lookup, canonicalize, fold)
+            continue
+
+        fn = Function.of(func)
+        for block in fn.blocks:
+            lvn_block(block, lookup, canonicalize, fold)
+        fn.changed()
 
 
 if __name__ == '__main__':
-    bril = json.load(sys.stdin)
-    lvn(bril, '-p' in sys.argv, '-c' in sys.argv, '-f' in sys.argv)
+    bril = load_bril()
+    try:
+        lvn(bril, '-p' in sys.argv, '-c' in sys.argv, '-f' in sys.argv,
+            '-g' in sys.argv)
+    except ValueError as exc:
+        sys.exit('lvn: {}'.format(exc))
     json.dump(bril, sys.stdout, indent=2, sort_keys=True)
@@ -0,0 +1,104 @@
+"""A registry of Bril opcodes and their properties.
+
+Every opcode gets a set of property flags. The `*_OPS` sets hold every
+opcode with a given flag, so passes can check properties like "is this a
+terminator?" with a single set lookup instead of comparing strings
+against lists of names.
+"""
+
+import sys
+
+# Property flags.
+TERMINATOR = 1 << 0   # Ends a basic block.
+PURE = 1 << 1         # Result depends only on the arguments; no effects.
+COMMUTATIVE = 1 << 2  # The two arguments can be swapped.
+EFFECT = 1 << 3       # Has side effects, so it must not be removed.
+MEMORY = 1 << 4       # Reads or writes memory.
+
+# The flags for every opcode.
+OPCODES = {
+    # Core.
+    'const': PURE,
+    'add': PURE | COMMUTATIVE,
+    'mul': PURE | COMMUTATIVE,
+    'sub': PURE,
+    'div': PURE,
+    'eq': PURE | COMMUTATIVE,
+    'lt': PURE,
+    'gt': PURE,
+    'le': PURE,
+    'ge': PURE,
+    'not': PURE,
+    'and': PURE | COMMUTATIVE,
+    'or': PURE | COMMUTATIVE,
+    'jmp': TERMINATOR,
+    'br': TERMINATOR,
+    'call': EFFECT,
+    'ret': TERMINATOR,
+    'id': PURE,
+    'print': EFFECT,
+    'nop': 0,
+
+    # SSA.
+    'phi': 0,
+
+    # Memory.
+    'alloc': EFFECT | MEMORY,
+    'free': EFFECT | MEMORY,
+    'store': EFFECT | MEMORY,
+    'load': MEMORY,
+    'ptradd': PURE,
+
+    # Floating point.
+    'fadd': PURE | COMMUTATIVE,
+    'fmul': PURE | COMMUTATIVE,
+    'fsub': PURE,
+    'fdiv': PURE,
+    'feq': PURE | COMMUTATIVE,
+    'flt': PURE,
+    'fle': PURE,
+    'fgt': PURE,
+    'fge': PURE,
+
+    # Speculative execution.
+    'speculate': EFFECT,
+    'commit': EFFECT,
+    'guard': EFFECT,
+
+    # Characters.
+    'ceq': PURE | COMMUTATIVE,
+    'clt': PURE,
+    'cle': PURE,
+    'cgt': PURE,
+    'cge': PURE,
+    'char2int': PURE,
+    'int2char': PURE,
+}
+
+
+def ops_with(flag):
+    """Get the set of all known opcodes with a given flag."""
+    return frozenset(name for name, f in OPCODES.items() if f & flag)
+
+
+TERMINATOR_OPS = ops_with(TERMINATOR)
+PURE_OPS = ops_with(PURE)
+COMMUTATIVE_OPS = ops_with(COMMUTATIVE)
+EFFECT_OPS = ops_with(EFFECT)
+MEMORY_OPS = ops_with(MEMORY)
+
+# The registry's string for each opcode.
+_OP_NAMES = {name: name for name in OPCODES}
+
+
+def intern_ops(bril):
+    """Make every instruction in a program share the registry's string
+    for its opcode, so comparing opcodes only has to compare pointers.
+    Return the program.
+    """
+    for func in bril['functions']:
+        for instr in func['instrs']:
+            if 'op' in instr:
+                op = instr['op']
+                instr['op'] = _OP_NAMES.get(op) or sys.intern(op)
+    return bril
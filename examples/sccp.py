@@ -0,0 +1,262 @@
+"""Sparse conditional constant propagation (Wegman & Zadeck) for Bril
+programs in SSA form, like the output of `to_ssa.py`:
+
+    $ bril2json < prog.bril | python to_ssa.py | python sccp.py
+
+Every SSA variable starts out "undetermined" and can only move down the
+lattice to a constant and then to "overdefined." Two worklists drive the
+analysis: one of CFG edges that have become executable and one of
+instructions whose arguments have changed (found via def-use chains), so
+each instruction is re-evaluated only when something it depends on
+changes. Only the executable successors of a branch are followed, so
+constants on one side of a branch are not spoiled by code that never
+runs. Every variable changes at most twice, so the whole analysis takes
+time proportional to the size of the function.
+
+Afterward, instructions with constant results become `const`s,
+branches on constant conditions become jumps, unreachable blocks are
+deleted, and phi-nodes drop the arguments for edges that are never
+taken. Run `tdce.py` afterward to remove the code this leaves dead.
+"""
+
+import json
+import sys
+from collections import defaultdict
+
+import instrument
+from cfg import reassemble
+from function import Function
+from is_ssa import func_is_ssa
+from util import load_bril
+
+# The bottom of the lattice: a value that is not a known constant. (The
+# top, a value that is not determined yet, is just a missing entry.)
+OVERDEFINED = object()
+
+
+def _wrap(n):
+    """Wrap an integer to 64-bit two's complement, like the interpreter.
+    """
+    n &= (1 << 64) - 1
+    return n - (1 << 64) if n >= 1 << 63 else n
+
+
+def _div(a, b):
+    # Integer division truncates toward zero.
+    q = abs(a) // abs(b)
+    return q if (a < 0) == (b < 0) else -q
+
+
+# Operations we can evaluate on constant arguments.
+FOLDABLE_OPS = {
+    'add': lambda a, b: _wrap(a + b),
+    'mul': lambda a, b: _wrap(a * b),
+    'sub': lambda a, b: _wrap(a - b),
+    'div': lambda a, b: _wrap(_div(a, b)),
+    'eq': lambda a, b: a == b,
+    'lt': lambda a, b: a < b,
+    'gt': lambda a, b: a > b,
+    'le': lambda a, b: a <= b,
+    'ge': lambda a, b: a >= b,
+    'not': lambda a: not a,
+    'and': lambda a, b: a and b,
+    'or': lambda a, b: a or b,
+    'id': lambda a: a,
+}
+
+
+def meet(a, b):
+    """Combine two lattice values, where `None` is undetermined."""
+    if a is None:
+        return b
+    if b is None or a == b:
+        return a
+    return OVERDEFINED
+
+
+def evaluate(instr, values):
+    """Get the lattice value for an instruction's result (`None` if it
+    is still undetermined), given the current values of the variables.
+    """
+    op = instr['op']
+    if op == 'const':
+        return instr['value']
+    if op not in FOLDABLE_OPS:
+        return OVERDEFINED
+
+    args = [values.get(a) for a in instr['args']]
+
+    # `false and x` and `true or x` don't depend on `x`.
+    if op == 'and' and False in args:
+        return False
+    if op == 'or' and True in args:
+        return True
+
+    if OVERDEFINED in args:
+        return OVERDEFINED
+    if None in args:
+        return None
+    if op == 'div' and args[1] == 0:
+        return OVERDEFINED  # A run-time error; leave it alone.
+    return FOLDABLE_OPS[op](*args)
+
+
+def sccp_analyze(func, graph):
+    """Run the analysis on a function's CFG. Return the lattice values
+    for the variables and the set of executable `(pred, succ)` edges.
+    The entry block's edge has `None` as its predecessor.
+    """
+    blocks = graph.blocks
+    entry = next(iter(blocks))
+
+    # Arguments could be anything.
+    values = {a['name']: OVERDEFINED for a in func.get('args', [])}
+
+    # Def-use chains: the instructions (and their blocks) that use each
+    # variable.
+    uses = defaultdict(list)
+    for name, block in blocks.items():
+        for instr in block:
+            for arg in instr.get('args', []):
+                uses[arg].append((name, instr))
+
+    executable = set()  # Edges.
+    visited = set()  # Blocks.
+    flow_worklist = [(None, entry)]
+    ssa_worklist = []
+    iterations = 0
+
+    def visit(name, instr):
+        op = instr['op']
+        if op == 'phi':
+            new = None
+            for label, arg in zip(instr['labels'], instr['args']):
+                if (label, name) in executable:
+                    new = meet(new, values.get(arg))
+        elif op == 'br':
+            cond = values.get(instr['args'][0])
+            if cond is OVERDEFINED:
+                targets = instr['labels']
+            elif cond is None:
+                targets = []
+            else:
+                targets = [instr['labels'][0 if cond else 1]]
+            flow_worklist.extend((name, t) for t in targets)
+            return
+        elif op == 'jmp':
+            flow_worklist.append((name, instr['labels'][0]))
+            return
+        elif 'dest' in instr:
+            new = evaluate(instr, values)
+        else:
+            return
+
+        dest = instr['dest']
+        if new is not None and values.get(dest) is not OVERDEFINED and \
+           values.get(dest) != new:
+            values[dest] = new
+            ssa_worklist.extend(uses[dest])
+
+    while flow_worklist or ssa_worklist:
+        while flow_worklist:
+            edge = flow_worklist.pop()
+            if edge in executable:
+                continue
+            executable.add(edge)
+            iterations += 1
+
+            name = edge[1]
+            if name in visited:
+                # Only the phi-nodes can see the new edge.
+                for instr in blocks[name]:
+                    if instr.get('op') == 'phi':
+                        visit(name, instr)
+            else:
+                visited.add(name)
+                for instr in blocks[name]:
+                    if 'op' in instr:
+                        visit(name, instr)
+
+        while ssa_worklist:
+            name, instr = ssa_worklist.pop()
+            iterations += 1
+            if name in visited:
+                visit(name, instr)
+
+    instrument.count('iterations', iterations)
+    return values, executable
+
+
+@instrument.traced(size=instrument.func_size)
+def func_sccp(func):
+    """Run SCCP on a function in place. Raise a `ValueError` if the
+    function is not in SSA form.
+    """
+    fn = Function.of(func)
+    if not func_is_ssa(fn.func):
+        raise ValueError('@{} is not in SSA form (use to_ssa.py)'.format(
+            fn.name))
+    graph = fn.cfg()
+    blocks = graph.blocks
+    values, executable = sccp_analyze(fn.func, graph)
+    reached = {succ for _, succ in executable}
+
+    new_blocks = {}
+    for name, block in blocks.items():
+        if name not in reached:
+            continue  # Delete unreachable blocks.
+
+        # Phi-nodes stay at the head of the block, so the constants
+        # that replace some of them go after the rest.
+        phis = []
+        folded_phis = []
+        new_block = []
+        for instr in block:
+            value = values.get(instr.get('dest'))
+            if value is not None and value is not OVERDEFINED:
+                # Replace anything with a constant result with a
+                # constant.
+                if instr['op'] != 'const':
+                    const = {
+                        'op': 'const',
+                        'dest': instr['dest'],
+                        'type': instr['type'],
+                        'value': value,
+                    }
+                    if instr['op'] == 'phi':
+                        folded_phis.append(const)
+                        continue
+                    instr = const
+            elif instr.get('op') == 'phi':
+                # Drop the arguments for edges that are never taken.
+                pairs = [(label, arg) for label, arg
+                         in zip(instr['labels'], instr['args'])
+                         if (label, name) in executable]
+                phis.append(dict(instr,
+                                 labels=[p[0] for p in pairs],
+                                 args=[p[1] for p in pairs]))
+                continue
+            elif instr.get('op') == 'br':
+                # Keep only the branch targets that are ever taken.
+                targets = [t for t in instr['labels']
+                           if (name, t) in executable]
+                if len(targets) == 1:
+                    instr = {'op': 'jmp', 'labels': targets}
+            new_block.append(instr)
+        new_blocks[name] = phis + folded_phis + new_block
+
+    fn.set_instrs(reassemble(new_blocks))
+
+
+def sccp(bril):
+    for func in bril['functions']:
+        func_sccp(func)
+    return bril
+
+
+if __name__ == '__main__':
+    try:
+        bril = sccp(load_bril())
+    except ValueError as exc:
+        sys.exit('sccp: {}'.format(exc))
+    print(json.dumps(bril, indent=2, sort_keys=True))
@@ -4,8 +4,9 @@ local optimization.
 
 import sys
 import json
-from form_blocks import form_blocks
-from util import flatten
+import instrument
+from function import Function
+from util import load_bril
 
 
 def trivial_dce_pass(func):
@@ -13,7 +14,8 @@ def trivial_dce_pass(func):
     to any other instruction. Return a bool indicating whether we deleted
     anything.
     """
-    blocks = list(form_blocks(func['instrs']))
+    fn = Function.of(func)
+    blocks = fn.blocks
 
     # Find all the variables used as an argument to any instruction,
     # even once.
@@ -40,18 +42,25 @@ def trivial_dce_pass(func):
         block[:] = new_block
 
     # Reassemble the function.
-    func['instrs'] = flatten(blocks)
+    if changed:
+        fn.changed()
 
     return changed
 
 
+@instrument.traced(size=instrument.func_size)
 def trivial_dce(func):
     """Iteratively remove dead instructions, stopping when nothing
     remains to remove.
     """
+    # Form the blocks once and reuse them on every iteration.
+    fn = Function.of(func)
+
     # An exercise for the reader: prove that this loop terminates.
-    while trivial_dce_pass(func):
-        pass
+    iterations = 1
+    while trivial_dce_pass(fn):
+        iterations += 1
+    instrument.count('iterations', iterations)
 
 
 def drop_killed_local(block):
@@ -97,19 +106,24 @@ def drop_killed_pass(func):
     """Drop killed functions from *all* blocks. Return a bool indicating
     whether anything changed.
     """
-    blocks = list(form_blocks(func['instrs']))
+    fn = Function.of(func)
     changed = False
-    for block in blocks:
+    for block in fn.blocks:
         changed |= drop_killed_local(block)
-    func['instrs'] = flatten(blocks)
+    if changed:
+        fn.changed()
     return changed
 
 
+@instrument.traced(size=instrument.func_size)
 def trivial_dce_plus(func):
     """Like `trivial_dce`, but also deletes locally killed instructions.
     """
-    while trivial_dce_pass(func) or drop_killed_pass(func):
-        pass
+    fn = Function.of(func)
+    iterations = 1
+    while trivial_dce_pass(fn) or drop_killed_pass(fn):
+        iterations += 1
+    instrument.count('iterations', iterations)
 
 
 MODES = {
@@ -127,7 +141,7 @@ def localopt():
         modify_func = trivial_dce
 
     # Apply the change to all the functions in the input program.
-    bril = json.load(sys.stdin)
+    bril = load_bril()
     for func in bril['functions']:
         modify_func(func)
     json.dump(bril, sys.stdout, indent=2, sort_keys=True)
@@ -0,0 +1,33 @@
+"""Generate a function with a long chain of if-then-else diamonds,
+50,000 blocks in all (or the number given on the command line), which
+makes a very deep dominator tree.
+"""
+import json
+import sys
+
+N = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+
+instrs = [
+    {'op': 'const', 'dest': 'x', 'type': 'int', 'value': 0},
+    {'op': 'const', 'dest': 'one', 'type': 'int', 'value': 1},
+    {'op': 'const', 'dest': 'two', 'type': 'int', 'value': 2},
+]
+for i in range(0, N - 3, 3):
+    instrs += [
+        {'label': 'l{}'.format(i)},
+        {'op': 'lt', 'dest': 'c', 'type': 'bool', 'args': ['x', 'two']},
+        {'op': 'br', 'args': ['c'],
+         'labels': ['l{}'.format(i + 1), 'l{}'.format(i + 2)]},
+        {'label': 'l{}'.format(i + 1)},
+        {'op': 'add', 'dest': 'x', 'type': 'int', 'args': ['x', 'one']},
+        {'op': 'jmp', 'labels': ['l{}'.format(i + 3)]},
+        {'label': 'l{}'.format(i + 2)},
+        {'op': 'sub', 'dest': 'x', 'type': 'int', 'args': ['x', 'one']},
+        {'op': 'jmp', 'labels': ['l{}'.format(i + 3)]},
+    ]
+instrs += [
+    {'label': 'l{}'.format(N - 1 - (N - 1) % 3)},
+    {'op': 'print', 'args': ['x']},
+]
+
+print(json.dumps({'functions': [{'name': 'main', 'instrs': instrs}]}))
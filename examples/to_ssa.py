@@ -1,10 +1,30 @@
+"""Convert Bril functions to SSA form:
+
+    $ bril2json < prog.bril | python to_ssa.py [--pruned | --semi-pruned]
+
+By default, this builds "minimal" SSA, which has a phi-node for a
+variable at every block in the iterated dominance frontier of its
+definitions, even where the variable is dead. Two options place fewer
+phi-nodes:
+
+- `--semi-pruned` only places phi-nodes for variables that are read in
+  some block before they are written there. Variables that only live
+  within single blocks never need them.
+- `--pruned` only places phi-nodes for variables that are live on entry
+  to the block, according to the `live` analysis from `df.py`. This
+  takes a dataflow analysis but places the fewest phi-nodes.
+"""
+
 import json
 import sys
 from collections import defaultdict
 
-from cfg import block_map, successors, add_terminators, add_entry, reassemble
-from form_blocks import form_blocks
-from dom import get_dom, dom_fronts, dom_tree
+from cfg import reassemble
+from df import ANALYSES, df_worklist, use
+from dom import Dominators
+import instrument
+from function import Function
+from util import load_bril
 
 
 def def_blocks(blocks):
@@ -18,76 +38,106 @@ def def_blocks(blocks):
     return dict(out)
 
 
-def get_phis(blocks, df, defs):
+def nonlocal_names(blocks):
+    """Get the variables that are read in some block before they are
+    written there. Only these can need phi-nodes.
+    """
+    out = set()
+    for block in blocks.values():
+        out |= use(block)
+    return out
+
+
+def get_phis(blocks, df, defs, live=None):
     """Find where to insert phi-nodes in the blocks.
 
     Produce a map from block names to variable names that need phi-nodes
     in those blocks. (We will need to generate names and actually insert
-    instructions later.)
+    instructions later.) If `live` maps blocks to the variables that are
+    live on entry to them, skip the phi-nodes for dead variables.
     """
     phis = {b: set() for b in blocks}
     for v, v_defs in defs.items():
         v_defs_list = list(v_defs)
+        v_defs_set = set(v_defs)
         for d in v_defs_list:
             for block in df[d]:
+                if live is not None and v not in live[block]:
+                    continue  # Dead here, so no phi-node.
+
                 # Add a phi-node...
                 if v not in phis[block]:
                     # ..unless we already did.
                     phis[block].add(v)
-                    if block not in v_defs_list:
+                    if block not in v_defs_set:
                         v_defs_list.append(block)
+                        v_defs_set.add(block)
     return phis
 
 
 def ssa_rename(blocks, phis, succ, domtree, args):
+    # The stack of names for each variable, with the current name on
+    # top (at the end).
     stack = defaultdict(list, {v: [v] for v in args})
     phi_args = {b: {p: [] for p in phis[b]} for b in blocks}
     phi_dests = {b: {p: None for p in phis[b]} for b in blocks}
     counters = defaultdict(int)
 
-    def _push_fresh(var):
+    def _push_fresh(var, pushed):
         fresh = '{}.{}'.format(var, counters[var])
         counters[var] += 1
-        stack[var].insert(0, fresh)
+        stack[var].append(fresh)
+        pushed.append(var)
         return fresh
 
     def _rename(block):
-        # Save stacks.
-        old_stack = {k: list(v) for k, v in stack.items()}
+        """Rename the variables in a block. Return a list of the
+        variables whose stacks got a new name pushed, which need to be
+        popped after visiting the block's children in the dominator
+        tree.
+        """
+        pushed = []
 
         # Rename phi-node destinations.
         for p in phis[block]:
-            phi_dests[block][p] = _push_fresh(p)
+            phi_dests[block][p] = _push_fresh(p, pushed)
 
         for instr in blocks[block]:
             # Rename arguments in normal instructions.
             if 'args' in instr:
-                new_args = [stack[arg][0] for arg in instr['args']]
+                new_args = [stack[arg][-1] for arg in instr['args']]
                 instr['args'] = new_args
 
             # Rename destinations.
             if 'dest' in instr:
-                instr['dest'] = _push_fresh(instr['dest'])
+                instr['dest'] = _push_fresh(instr['dest'], pushed)
 
         # Rename phi-node arguments (in successors).
         for s in succ[block]:
             for p in phis[s]:
                 if stack[p]:
-                    phi_args[s][p].append((block, stack[p][0]))
+                    phi_args[s][p].append((block, stack[p][-1]))
                 else:
                     # The variable is not defined on this path
                     phi_args[s][p].append((block, "__undefined"))
 
-        # Recursive calls.
-        for b in sorted(domtree[block]):
-            _rename(b)
-
-        # Restore stacks.
-        stack.clear()
-        stack.update(old_stack)
+        return pushed
 
+    # Walk the dominator tree depth-first, using an explicit stack
+    # rather than recursion so that deep trees work. When we finish a
+    # block's subtree, we undo its pushes using the list from `_rename`.
     entry = list(blocks.keys())[0]
-    _rename(entry)
+    work = [(entry, None)]
+    while work:
+        block, pushed = work.pop()
+        if pushed is not None:
+            for var in pushed:
+                stack[var].pop()
+            continue
+
+        work.append((block, _rename(block)))
+        for b in sorted(domtree[block], reverse=True):
+            work.append((b, None))
 
     return phi_args, phi_dests
 
@@ -116,31 +166,51 @@ def get_types(func):
     return types
 
 
-def func_to_ssa(func):
-    blocks = block_map(form_blocks(func['instrs']))
-    add_entry(blocks)
-    add_terminators(blocks)
-    succ = {name: successors(block[-1]) for name, block in blocks.items()}
-    dom = get_dom(succ, list(blocks.keys())[0])
-
-    df = dom_fronts(dom, succ)
+@instrument.traced(size=instrument.func_size)
+def func_to_ssa(func, pruning=None):
+    """Convert a function to SSA form in place. `pruning` may be
+    `'semi'` or `'full'` for semi-pruned or pruned SSA (see above).
+    """
+    fn = Function.of(func)
+    func = fn.func
+    graph = fn.cfg(entry=True)
+    blocks = graph.blocks
+    succ = graph.succs
+    dom = Dominators(succ, list(blocks.keys())[0])
+
+    df = dom.fronts
     defs = def_blocks(blocks)
     types = get_types(func)
     arg_names = {a['name'] for a in func['args']} if 'args' in func else set()
 
-    phis = get_phis(blocks, df, defs)
-    phi_args, phi_dests = ssa_rename(blocks, phis, succ, dom_tree(dom),
+    live = None
+    if pruning == 'semi':
+        names = nonlocal_names(blocks)
+        defs = {v: d for v, d in defs.items() if v in names}
+    elif pruning == 'full':
+        live, _ = df_worklist(blocks, ANALYSES['live'],
+                              (graph.preds, succ))
+
+    phis = get_phis(blocks, df, defs, live)
+    phi_args, phi_dests = ssa_rename(blocks, phis, succ, dom.tree,
                                      arg_names)
     insert_phis(blocks, phi_args, phi_dests, types)
 
-    func['instrs'] = reassemble(blocks)
+    fn.set_instrs(reassemble(blocks))
 
 
-def to_ssa(bril):
+def to_ssa(bril, pruning=None):
     for func in bril['functions']:
-        func_to_ssa(func)
+        func_to_ssa(func, pruning)
     return bril
 
 
 if __name__ == '__main__':
-    print(json.dumps(to_ssa(json.load(sys.stdin)), indent=2, sort_keys=True))
+    if '--pruned' in sys.argv[1:]:
+        pruning = 'full'
+    elif '--semi-pruned' in sys.argv[1:]:
+        pruning = 'semi'
+    else:
+        pruning = None
+    print(json.dumps(to_ssa(load_bril(), pruning), indent=2,
+                     sort_keys=True))
@@ -1,4 +1,10 @@
+import io
 import itertools
+import json
+import mmap
+import sys
+
+from opcodes import intern_ops
 
 
 def flatten(ll):
@@ -16,3 +22,35 @@ def fresh(seed, names):
         if name not in names:
             return name
         i += 1
+
+
+def _read(fp):
+    """Get the contents of a binary file, memory-mapping it if we can
+    (e.g., when standard input is redirected from a file).
+    """
+    try:
+        return mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+        return fp.read()
+
+
+def load_bril(fp=None, lazy=False):
+    """Read a Bril program from a binary file (standard input by
+    default).
+
+    The program may be in JSON or in the compact binary format from
+    `brilbin`, which must be installed to read the latter. With `lazy`,
+    the functions of an indexed binary program are decoded one at a
+    time as they are used. Each use decodes a fresh copy, so only passes
+    that do not modify the program should ask for this. Otherwise, the
+    opcodes in the program are interned (see `opcodes.intern_ops`).
+    """
+    data = _read(fp or sys.stdin.buffer)
+    if data[:4] == b'BRIL':
+        import brilbin
+        bril = brilbin.loads(data, lazy)
+        if lazy:
+            return bril
+    else:
+        bril = json.loads(bytes(data))
+    return intern_ops(bril)